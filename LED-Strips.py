@@ -2,25 +2,1873 @@
 # -*- coding: utf-8 -*-  
 
 import time
+# The start of the program, for the time to the first frame
+STARTED = time.time()
+
+import os
+import sys
+import mmap
+import struct
+import json
 import colorsys
 import math
 import random
+import argparse
+import queue
+import bisect
+import threading
+import collections
+import itertools
+import concurrent.futures
+import socket
+import importlib
 import logging as log
+# http.server, multiprocessing, the simulator and the benchmarks are only imported where they are used,
+# most runs do not need them and the imports would delay the first frame
+try:
+    import numpy as np
+except ImportError:
+    np = None
 #log.basicConfig(filename='log/LED-Strip.log',level=log.INFO,format='%(asctime)s %(message)s')
 
-from tinkerforge.ip_connection import IPConnection
-from tinkerforge.ip_connection import Error
-from tinkerforge.bricklet_led_strip import LEDStrip
-from tinkerforge.bricklet_multi_touch import MultiTouch
-from tinkerforge.bricklet_rotary_poti import RotaryPoti
+# All effects render whole frames with the frame_* functions below. A frame has three rows (red, green
+# and blue) with one 8 bit value per LED. With NumPy a frame is an uint8 array of shape (3, leds) which
+# is computed in one vectorized pass, without NumPy it is a list of three lists with the same values.
+
+# The hues of a rainbow over all LEDs
+def hue_ramp(leds):
+    if np is None:
+        return [1.*led/leds for led in range(leds)]
+    return np.arange(leds) / leds
+
+# Convert one HSV color per LED to RGB, the same as int(x*255) of colorsys.hsv_to_rgb for each LED
+def frame_hsv(hue, saturation, value):
+    if np is None:
+        frame = [[], [], []]
+        for h in hue:
+            rv, gv, bv = colorsys.hsv_to_rgb(h, saturation, value)
+            frame[0].append(int(rv*255))
+            frame[1].append(int(gv*255))
+            frame[2].append(int(bv*255))
+        return frame
+    # Same steps as colorsys.hsv_to_rgb, so the results are exactly the same
+    h = np.asarray(hue, dtype=float)
+    i = (h*6.0).astype(int)
+    f = (h*6.0) - i
+    p = np.full(h.shape, value*(1.0 - saturation))
+    q = value*(1.0 - saturation*f)
+    t = value*(1.0 - saturation*(1.0 - f))
+    v = np.full(h.shape, float(value))
+    i = i % 6
+    r = np.choose(i, (v, q, p, p, t, v))
+    g = np.choose(i, (t, v, v, q, p, p))
+    b = np.choose(i, (p, p, t, v, v, q))
+    return (np.stack((r, g, b)) * 255).astype(np.uint8)
+
+# The first active LEDs in one 8 bit color, the remaining LEDs dark
+def frame_solid(r, g, b, active_leds, leds):
+    if np is None:
+        dark_leds = leds - active_leds
+        return [[r]*active_leds + [0]*dark_leds, [g]*active_leds + [0]*dark_leds, [b]*active_leds + [0]*dark_leds]
+    frame = np.zeros((3, leds), dtype=np.uint8)
+    frame[:, :active_leds] = ((r,), (g,), (b,))
+    return frame
+
+# Add dark LEDs to a frame until it has the given length
+def frame_pad(frame, leds):
+    if np is None:
+        return [row + [0]*(leds - len(row)) for row in frame]
+    return np.pad(frame, ((0, 0), (0, leds - frame.shape[1])))
+
+# Rotate all LEDs of the frame by shift (-1 moves every color one LED to the front)
+def frame_roll(frame, shift):
+    if np is None:
+        return [row[-shift:] + row[:-shift] for row in frame]
+    return np.roll(frame, shift, axis=1)
+
+# Size of a frame in bytes
+def frame_bytes(frame):
+    if np is None:
+        return 3*len(frame[0])
+    return frame.nbytes
+
+# Preallocated frame of a strip: one bytearray with the red, green and blue plane and a memoryview
+# of each plane. A frame is written into it in place and the planes can be sliced and sent without
+# a copy. Each plane has padding zeros behind the LEDs, so a slice of a full chunk is always there.
+class frame_buffer:
+    __slots__ = ('leds', 'capacity', 'data', 'r', 'g', 'b')
+
+    def __init__(self, leds, padding=0):
+        self.leds = leds
+        self.capacity = leds + padding
+        self.data = bytearray(3 * self.capacity)
+        view = memoryview(self.data)
+        self.r = view[0:self.capacity]
+        self.g = view[self.capacity:2*self.capacity]
+        self.b = view[2*self.capacity:3*self.capacity]
+
+    # Write the values (lists, uint8 arrays or memoryviews) of the LEDs starting at index
+    def write(self, index, length, r, g, b):
+        for view, values in ((self.r, r), (self.g, g), (self.b, b)):
+            if isinstance(values, list):
+                values = bytes(values[:length])
+            # Buffers are copied directly into the plane
+            view[index:index+length] = values[:length]
+
+    def fill(self, r, g, b):
+        self.fill_range(0, self.leds, r, g, b)
+
+    # Set the LEDs from start to end to one color in place. The first LED is set and copied in doubling
+    # steps, so there is no temporary row of values.
+    def fill_range(self, start, end, r, g, b):
+        if start >= end:
+            return
+        for plane, value in ((self.r, r), (self.g, g), (self.b, b)):
+            plane[start] = value
+            filled = 1
+            while filled < end - start:
+                count = min(filled, end - start - filled)
+                plane[start+filled:start+filled+count] = plane[start:start+count]
+                filled = filled + count
+
+    # The first active LEDs in one color, the remaining LEDs dark (like frame_solid)
+    def solid(self, r, g, b, active_leds):
+        active_leds = max(0, min(active_leds, self.leds))
+        self.fill_range(0, active_leds, r, g, b)
+        self.fill_range(active_leds, self.leds, 0, 0, 0)
+
+    # Only the LED at index in one color
+    def dot(self, r, g, b, index):
+        self.fill_range(0, self.leds, 0, 0, 0)
+        self.r[index] = r
+        self.g[index] = g
+        self.b[index] = b
+
+    # Copy all LEDs of another buffer with the same size
+    def copy(self, other):
+        self.data[:] = other.data
+
+# Post-processing of the frames of a strip before they are sent, from the frame into the output buffer.
+# The gamma correction maps the values with a lookup table to 8.8 fixed point. The current limiter
+# estimates the current of the frame (led_current mA per color at full brightness plus idle_current
+# per LED) and scales the frame down to max_current. The temporal dithering adds the fractions which
+# were left over from the frames before, so on average each LED has its exact value. Without NumPy
+# the values are rounded and there is no dithering.
+class post_processor:
+    def __init__(self, frame, output, gamma=2.2, max_current=0, led_current=20, idle_current=1, dithering=False):
+        self.frame = frame
+        self.output = output
+        self.leds = frame.leds
+        self.max_current = max_current
+        self.led_current = led_current
+        self.idle_current = idle_current
+        self.dithering = dithering and np is not None
+        # The frame has to be sent again, so the fractions get shown
+        self.refresh = False
+        self.limited = 0
+        levels = [(value / 255) ** gamma * 255 for value in range(256)]
+        self.table = bytes(int(level + 0.5) for level in levels)
+        if np is not None:
+            self.table16 = np.array([int(level * 256 + 0.5) for level in levels], dtype=np.uint32)
+            self.source = np.frombuffer(frame.data, np.uint8).reshape(3, frame.capacity)[:, :self.leds]
+            self.target = np.frombuffer(output.data, np.uint8).reshape(3, output.capacity)[:, :self.leds]
+            self.values = np.zeros((3, self.leds), np.uint32)
+            self.error = np.zeros((3, self.leds), np.uint32)
+
+    # The factor which brings the current of the frame down to the budget (1 if it is below)
+    def limit(self, total):
+        idle = self.idle_current * self.leds
+        current = total * self.led_current + idle
+        if self.max_current <= 0 or current <= self.max_current:
+            return 1.0
+        self.limited = self.limited + 1
+        return max(0, self.max_current - idle) / (current - idle)
+
+    def process(self):
+        if np is None:
+            planes = ((self.frame.r, self.output.r), (self.frame.g, self.output.g), (self.frame.b, self.output.b))
+            for source, target in planes:
+                target[0:self.leds] = source[0:self.leds].tobytes().translate(self.table)
+            scale = self.limit(sum(sum(target[0:self.leds]) for source, target in planes) / 255)
+            if scale < 1:
+                table = bytes(int(value * scale) for value in range(256))
+                for source, target in planes:
+                    target[0:self.leds] = target[0:self.leds].tobytes().translate(table)
+            return
+
+        np.take(self.table16, self.source, out=self.values)
+        if self.max_current > 0:
+            # Full brightness of a color is 255 in 8.8 fixed point
+            scale = self.limit(int(self.values.sum()) / (255 * 256))
+            if scale < 1:
+                np.multiply(self.values, int(scale * 65536), out=self.values)
+                np.right_shift(self.values, 16, out=self.values)
+        if self.dithering:
+            np.add(self.values, self.error, out=self.values)
+            np.bitwise_and(self.values, 0xff, out=self.error)
+            self.refresh = bool(self.error.any())
+        else:
+            np.add(self.values, 128, out=self.values)
+        np.right_shift(self.values, 8, out=self.values)
+        np.copyto(self.target, self.values, casting='unsafe')
+
+# Blend of the frames of two effects for a transition. The outgoing and the incoming effect render into
+# their own buffers and blend() mixes them into the output buffer. The curve gives the weight of the
+# incoming frame (0-256) for the progress of the transition (0-1): 'linear', 'eased' (slow at the start
+# and at the end) or 'wipe', where the incoming frame moves in from the first LED with a soft edge of
+# edge times the strip length. Without NumPy the same integer blend is computed per LED.
+class frame_blend:
+    CURVES = ('linear', 'eased', 'wipe')
+
+    def __init__(self, leds, curve='eased', edge=0.1):
+        if curve not in self.CURVES:
+            raise ValueError('Unknown transition curve: ' + str(curve))
+        self.leds = leds
+        self.curve = curve
+        # The edge of the wipe is at least one LED wide
+        self.edge = max(edge, 1 / max(leds, 1))
+        self.outgoing = frame_buffer(leds)
+        self.incoming = frame_buffer(leds)
+        self.output = frame_buffer(leds)
+        if np is not None:
+            self.sources = [np.frombuffer(buffer.data, np.uint8).reshape(3, leds) for buffer in (self.outgoing, self.incoming)]
+            self.target = np.frombuffer(self.output.data, np.uint8).reshape(3, leds)
+            self.mixed = np.zeros((3, leds), np.uint16)
+            self.other = np.zeros((3, leds), np.uint16)
+            # The position of each LED in edge widths and the weights of the wipe per LED
+            self.positions = np.arange(leds) / (leds * self.edge)
+            self.front = np.zeros(leds)
+            self.weights = np.zeros(leds, np.uint16)
+            self.inverse = np.zeros(leds, np.uint16)
+
+    # The weight of the incoming frame, one for all LEDs or one per LED for the wipe
+    def weight(self, progress):
+        progress = min(max(progress, 0.0), 1.0)
+        if self.curve == 'linear':
+            return int(progress * 256)
+        if self.curve == 'eased':
+            return int(progress * progress * (3 - 2 * progress) * 256)
+        front = progress * (1 + self.edge) / self.edge
+        if np is None:
+            return [int(min(max(front - led / (self.leds * self.edge), 0.0), 1.0) * 256) for led in range(self.leds)]
+        np.subtract(front, self.positions, out=self.front)
+        np.clip(self.front, 0.0, 1.0, out=self.front)
+        np.multiply(self.front, 256, out=self.front)
+        np.copyto(self.weights, self.front, casting='unsafe')
+        return self.weights
+
+    def blend(self, progress):
+        weight = self.weight(progress)
+        if np is None:
+            weights = weight if isinstance(weight, list) else [weight] * self.leds
+            planes = ((self.outgoing.r, self.incoming.r, self.output.r), (self.outgoing.g, self.incoming.g, self.output.g),
+                      (self.outgoing.b, self.incoming.b, self.output.b))
+            for outgoing, incoming, target in planes:
+                target[0:self.leds] = bytes((a * (256 - w) + b * w) >> 8 for a, b, w in zip(outgoing, incoming, weights))
+            return
+        if isinstance(weight, int):
+            inverse = 256 - weight
+        else:
+            np.subtract(256, weight, out=self.inverse)
+            inverse = self.inverse
+        outgoing, incoming = self.sources
+        # out = (outgoing * (256 - weight) + incoming * weight) / 256, at most 255 * 256 in uint16
+        np.copyto(self.mixed, outgoing)
+        np.multiply(self.mixed, inverse, out=self.mixed)
+        np.copyto(self.other, incoming)
+        np.multiply(self.other, weight, out=self.other)
+        np.add(self.mixed, self.other, out=self.mixed)
+        np.right_shift(self.mixed, 8, out=self.mixed)
+        np.copyto(self.target, self.mixed, casting='unsafe')
+
+# Bounded LRU cache for the precomputed frames of periodic effects. The key has to contain everything
+# the frames depend on (effect, parameters and strip length), so a hit can be played back directly.
+class frame_cache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # Get the frames for the key, on a miss they are rendered by calling function(*args)
+    def get(self, key, function, *args):
+        with self.lock:
+            frames = self.entries.get(key)
+            if frames is not None:
+                self.entries.move_to_end(key)
+                self.hits = self.hits + 1
+                return frames
+            self.misses = self.misses + 1
+        frames = function(*args)
+        size = sum(frame_bytes(frame) for frame in frames)
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = frames
+                self.bytes = self.bytes + size
+                # Remove the least recently used frames until it fits again
+                while self.bytes > self.max_bytes:
+                    old_key, old_frames = self.entries.popitem(last=False)
+                    self.bytes = self.bytes - sum(frame_bytes(frame) for frame in old_frames)
+        return frames
+
+    # Drop all frames, e.g. after the color was changed
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / requests if requests else 0.0,
+                    'entries': len(self.entries), 'bytes': self.bytes}
+
+# Histograms and counters for the hot paths. They are exported in the Prometheus text format and can
+# be written to the log periodically. While disabled a call site costs only the check of enabled.
+# Collectors are functions which return (name, labels, value) of counters which are kept elsewhere.
+class metrics_registry:
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.server = None
+        self.timer = None
+
+    # Add to a counter, labels is a tuple of (name, value) pairs
+    def count(self, name, labels=(), value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    # Add a duration in seconds to a histogram
+    def observe(self, name, labels, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram == None:
+                # Counts per bucket (the last one is +Inf), the sum and the count
+                histogram = self.histograms[(name, labels)] = [[0]*(len(self.BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def collect(self):
+        counters = []
+        for collector in self.collectors:
+            counters.extend(collector())
+        with self.lock:
+            counters.extend((name, labels, value) for (name, labels), value in self.counters.items())
+            histograms = [(name, labels, list(buckets), total, count) for (name, labels), (buckets, total, count) in self.histograms.items()]
+        return sorted(counters), sorted(histograms)
+
+    # All metrics in the Prometheus text format
+    def render(self):
+        def format_labels(labels):
+            if not labels:
+                return ''
+            return '{' + ','.join(key + '="' + str(value) + '"' for key, value in labels) + '}'
+
+        counters, histograms = self.collect()
+        lines = []
+        typed = set()
+        for name, labels, value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE ' + name + ' counter')
+            lines.append(name + format_labels(labels) + ' ' + str(value))
+        for name, labels, buckets, total, count in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE ' + name + ' histogram')
+            cumulative = 0
+            for bound, bucket in zip(self.BUCKETS + ('+Inf',), buckets):
+                cumulative = cumulative + bucket
+                lines.append(name + '_bucket' + format_labels(labels + (('le', bound),)) + ' ' + str(cumulative))
+            lines.append(name + '_sum' + format_labels(labels) + ' ' + repr(total))
+            lines.append(name + '_count' + format_labels(labels) + ' ' + str(count))
+        return '\n'.join(lines) + '\n'
+
+    # One log line per metric: name, labels and the value or the count, sum and mean of a histogram
+    def log(self):
+        counters, histograms = self.collect()
+        for name, labels, value in counters:
+            log.info('metric=' + name + ''.join(' ' + key + '=' + str(label) for key, label in labels) + ' value=' + str(value))
+        for name, labels, buckets, total, count in histograms:
+            log.info('metric=' + name + ''.join(' ' + key + '=' + str(label) for key, label in labels) +
+                     ' count=' + str(count) + ' sum={0:.6f} mean={1:.6f}'.format(total, total / count if count else 0.0))
+
+    # Serve the metrics on http://localhost:port/metrics
+    def serve(self, port):
+        import http.server
+        registry = self
+        class handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.enabled = True
+        self.server = http.server.ThreadingHTTPServer(('localhost', port), handler)
+        thread = threading.Thread(target=self.server.serve_forever, name='LED-Strips metrics')
+        thread.daemon = True
+        thread.start()
+
+    # Write the metrics to the log every interval seconds
+    def log_periodically(self, interval):
+        self.enabled = True
+        self.timer = threading.Event()
+        def run():
+            while not self.timer.wait(interval):
+                self.log()
+        thread = threading.Thread(target=run, name='LED-Strips metrics log')
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.timer != None:
+            self.timer.set()
+
+# Render thread which runs one effect at a time as a per-frame generator.
+# An effect yields the delay until its next frame after each frame it has pushed to the strips,
+# so it can be replaced or cancelled between two frames instead of blocking a callback thread.
+# Before each frame the tick function applies the input which came in since the last frame.
+class render_thread(threading.Thread):
+    # With a clock (a function which returns the next tick of a shared frame clock for a time) each
+    # effect starts at a tick of the clock, so processes which share the clock show their frames in
+    # step. Between the ticks the effect keeps its own pace, like the strips do. With a transition (a
+    # function which returns one effect for the outgoing and the incoming effect) an effect which is
+    # played with a transition replaces the running one through it.
+    def __init__(self, tick=None, tick_period=0.02, metrics=None, clock=None, transition=None):
+        threading.Thread.__init__(self, name='LED-Strips render')
+        self.daemon = True
+        self.metrics = metrics if metrics != None else metrics_registry()
+        self.condition = threading.Condition()
+        self.tick = tick
+        self.tick_period = tick_period
+        self.clock = clock
+        self.transition = transition
+        self.effect = None
+        self.key = None
+        # The label of the effect which renders the current frame
+        self.label = None
+        self.fade = False
+        self.generation = 0
+        self.pending = False
+        self.running = True
+
+    # Replace the running effect, with a transition from the running one if there is a transition
+    # function. If the same key is still running the new effect is ignored.
+    def play(self, effect, key=None, transition=False):
+        with self.condition:
+            if key is not None and key == self.key and self.effect is not None:
+                return False
+            self.effect = effect
+            self.key = key
+            self.fade = transition and self.transition is not None
+            self.generation = self.generation + 1
+            self.condition.notify_all()
+            return True
+
+    # Cancel the running effect, it will not render another frame (or fades out with a transition)
+    def cancel(self, transition=False):
+        self.play(None, transition=transition)
+
+    # The label of the effect which renders the current frame, None outside of an effect (e.g. for the
+    # frames of the tick function or of another thread)
+    def rendering(self):
+        return self.label if threading.current_thread() is self else None
+
+    # New input is available, run the tick function as soon as possible
+    def wake(self):
+        with self.condition:
+            self.pending = True
+            self.condition.notify_all()
+
+    # Block until the running effect has finished (or was cancelled)
+    def wait(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: self.effect is None, timeout)
+
+    # Stop the thread after the current frame
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.join()
+
+    def run(self):
+        effect = None
+        # The label of the effect in the metrics, its key (e.g. the name of the plugin). A transition
+        # counts for the effect it fades to.
+        label = 'none'
+        generation = -1
+        # Time of the next frame of the effect and of the next tick while the input is still changing
+        frame_due = 0
+        tick_due = None
+        while True:
+            with self.condition:
+                while self.running and self.generation == generation and not self.pending:
+                    now = time.time()
+                    timeouts = []
+                    if effect is not None:
+                        timeouts.append(frame_due - now)
+                    if tick_due is not None:
+                        timeouts.append(tick_due - now)
+                    if timeouts and min(timeouts) <= 0:
+                        break
+                    self.condition.wait(min(timeouts) if timeouts else None)
+                if not self.running:
+                    break
+                if self.generation != generation:
+                    if self.fade and (effect is not None or self.effect is not None):
+                        # The running effect goes on in the transition to the new one
+                        effect = self.transition(effect, self.effect)
+                    else:
+                        if effect is not None:
+                            effect.close()
+                        effect = self.effect
+                    label = self.key if self.key is not None else getattr(self.effect, '__name__', 'none')
+                    generation = self.generation
+                    frame_due = self.next_tick(time.time())
+                pending = self.pending
+                self.pending = False
+
+            # Apply the newest input, the tick function may start another effect
+            if self.tick is not None and (pending or (tick_due is not None and time.time() >= tick_due)):
+                try:
+                    moving = self.tick()
+                except Exception as e:
+                    log.error('Tick failed: ' + str(e))
+                    moving = False
+                tick_due = time.time() + self.tick_period if moving else None
+
+            # The tick function may have replaced the effect, then the new one starts with the next round
+            if effect is None or self.generation != generation or time.time() < frame_due:
+                continue
+
+            # Render exactly one frame of the effect
+            if self.metrics.enabled:
+                render_start = time.perf_counter()
+            self.label = label
+            try:
+                delay = next(effect)
+            except StopIteration:
+                delay = None
+            except Exception as e:
+                log.error('Effect failed: ' + str(e))
+                delay = None
+            finally:
+                self.label = None
+            if self.metrics.enabled and delay != None:
+                self.metrics.observe('ledstrips_render_seconds', (('effect', label),), time.perf_counter() - render_start)
+
+            if delay is None:
+                effect.close()
+                effect = None
+                with self.condition:
+                    if self.generation == generation:
+                        self.effect = None
+                        self.key = None
+                        self.condition.notify_all()
+                continue
+            # Keep the pace of the effect, but do not try to catch up if it is late
+            frame_due = frame_due + delay
+            if frame_due < time.time():
+                frame_due = self.next_tick(time.time())
+
+        if effect is not None:
+            effect.close()
+
+    def next_tick(self, when):
+        return self.clock(when) if self.clock != None else when
+
+# Input of the rotary poti. The callback only stores the newest position and the render thread takes
+# it once per tick, so a burst of position callbacks ends up as one update. The position can be
+# smoothed over several ticks and changes smaller than the hysteresis are ignored.
+class poti_input:
+    def __init__(self, smoothing, hysteresis):
+        # Part of the remaining distance which is kept per tick (0 = no smoothing)
+        self.smoothing = smoothing
+        self.hysteresis = hysteresis
+        self.lock = threading.Lock()
+        # The newest position from the callback which is not reached yet
+        self.target = None
+        self.latest = None
+        self.smoothed = None
+        # The last position which was applied
+        self.position = None
+        self.events = 0
+        self.applied = 0
+        # When the oldest position which is not applied yet came in and the delay until it was applied
+        self.received = None
+        self.delay = 0.0
+
+    # Called by the position callback, a newer position replaces the one which is not applied yet
+    def update(self, position):
+        with self.lock:
+            if self.target == None:
+                self.received = time.time()
+            self.target = position
+            self.latest = position
+            self.events = self.events + 1
+
+    # Called once per tick. Returns the position to apply (or None) and whether it is still moving.
+    def take(self):
+        with self.lock:
+            target = self.target
+        if target is None:
+            return None, False
+        if self.smoothed is None or self.smoothing <= 0:
+            smoothed = target
+        else:
+            smoothed = self.smoothed + (target - self.smoothed) * (1 - self.smoothing)
+            if abs(target - smoothed) < 0.5:
+                smoothed = target
+        self.smoothed = smoothed
+        moving = smoothed != target
+        if not moving:
+            with self.lock:
+                # A newer position stays for the next tick
+                if self.target == target:
+                    self.target = None
+        if self.position is not None and abs(smoothed - self.position) < self.hysteresis:
+            return None, moving
+        self.position = smoothed
+        self.applied = self.applied + 1
+        self.delay = time.time() - self.received
+        return smoothed, moving
+
+# Output stage for one LED strip. The strip renders a frame every frame duration and reports it with
+# the frame rendered callback. Only then the next frame is sent, everything pushed in the meantime
+# is merged into one pending frame, so older frames are dropped and the newest one wins.
+class strip_output:
+    __slots__ = ('led_strip', 'frame_duration', 'policy', 'error', 'missing_since', 'leds', 'labels', 'metrics', 'lock',
+                 'frame', 'output', 'post', 'dirty', 'busy', 'sent_time', 'sent', 'resend', 'timeout', 'frames_sent', 'frames_dropped', 'effect', 'effect_sent', 'effect_dropped',
+                 'frames_coalesced', 'frames_skipped', 'packets_sent', 'packets_saved', 'rendered', 'latencies')
+
+    # The bricklet protocol takes 16 LEDs per set_rgb_values call
+    CHUNK_LEDS = 16
+    # Size of one set_rgb_values packet (8 bytes header, index, length and 16 values per color)
+    PACKET_BYTES = 8 + 3 + 3*16
+
+    # While the strip is missing the newest frame is kept and sent as soon as the strip is back
+    # ('buffer') or the frames are dropped ('drop'). With the settings of a post_processor (post)
+    # the frames are post-processed before they are sent. Only the error of the backend (error) and
+    # OSError detach the strip, any other exception is a bug and raised.
+    def __init__(self, led_strip, frame_duration, leds, name='', metrics=None, policy='buffer', post=None, error=OSError):
+        self.led_strip = None
+        self.frame_duration = frame_duration
+        self.policy = policy
+        self.error = error
+        self.missing_since = time.time()
+        self.leds = leds
+        self.labels = (('strip', name),)
+        self.metrics = metrics if metrics != None else metrics_registry()
+        self.lock = threading.Lock()
+        # The newest frame and whether it still has to be sent
+        self.frame = frame_buffer(leds, self.CHUNK_LEDS)
+        self.post = None
+        self.output = self.frame
+        if post != None:
+            self.output = frame_buffer(leds, self.CHUNK_LEDS)
+            self.post = post_processor(self.frame, self.output, **post)
+        self.dirty = False
+        self.busy = False
+        self.sent_time = 0
+        # The last frame sent to the strip, only the changed LEDs are sent again (all after resend)
+        self.sent = frame_buffer(leds, self.CHUNK_LEDS)
+        self.resend = True
+        # If a frame rendered callback gets lost the strip is not blocked forever
+        self.timeout = max(0.1, 4 * frame_duration / 1000)
+        # Statistics
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        # The effect of the pending frame and the frames sent and dropped per effect
+        self.effect = 'none'
+        self.effect_sent = {}
+        self.effect_dropped = {}
+        self.frames_coalesced = 0
+        self.frames_skipped = 0
+        self.packets_sent = 0
+        self.packets_saved = 0
+        self.rendered = collections.deque(maxlen=50)
+        self.latencies = collections.deque(maxlen=1000)
+
+        if led_strip != None:
+            self.attach(led_strip)
+
+    # Configure the (new) strip and send the newest frame at once. The strip does not know the
+    # frame anymore, so all LEDs are sent again.
+    def attach(self, led_strip):
+        # The chunks of a frame are sent in one burst without waiting for a response in between
+        led_strip.set_response_expected(led_strip.FUNCTION_SET_RGB_VALUES, False)
+        led_strip.register_callback(led_strip.CALLBACK_FRAME_RENDERED, self.cb_frame_rendered)
+        led_strip.set_frame_duration(self.frame_duration)
+        with self.lock:
+            if self.led_strip == None:
+                self.metrics.observe('ledstrips_strip_missing_seconds', self.labels, time.time() - self.missing_since)
+            self.led_strip = led_strip
+            self.resend = True
+            self.busy = False
+            self.send()
+
+    # The strip is gone, nothing is sent until it is attached again
+    def detach(self):
+        with self.lock:
+            self.missing()
+
+    # Must be called with the lock held
+    def missing(self):
+        if self.led_strip != None:
+            self.missing_since = time.time()
+        self.led_strip = None
+        self.resend = True
+        self.busy = False
+
+    # Push a part of a frame (starting at index) of an effect (its label, None without one) to the strip
+    def push(self, index, length, r, g, b, effect=None):
+        # Everything behind the end of this strip is cut off
+        length = min(length, self.leds - index)
+        if length <= 0:
+            return
+        effect = effect if effect != None else 'none'
+        with self.lock:
+            if self.led_strip == None and self.policy == 'drop':
+                self.frames_dropped = self.frames_dropped + 1
+                self.effect_dropped[effect] = self.effect_dropped.get(effect, 0) + 1
+                return
+            if self.dirty:
+                # The last frame was not sent yet
+                if index == 0 and length >= self.leds:
+                    self.frames_dropped = self.frames_dropped + 1
+                    self.effect_dropped[self.effect] = self.effect_dropped.get(self.effect, 0) + 1
+                else:
+                    self.frames_coalesced = self.frames_coalesced + 1
+            self.frame.write(index, length, r, g, b)
+            self.effect = effect
+            self.dirty = True
+            if self.led_strip == None or (self.busy and time.time() - self.sent_time < self.timeout):
+                return
+            self.send()
+
+    # Callback of the strip, the last frame is rendered and the next one can be sent
+    def cb_frame_rendered(self, length):
+        with self.lock:
+            if self.led_strip == None:
+                return
+            now = time.time()
+            self.rendered.append(now)
+            if self.busy:
+                self.latencies.append(now - self.sent_time)
+                self.metrics.observe('ledstrips_frame_latency_seconds', self.labels, now - self.sent_time)
+            if self.dirty or (self.post != None and self.post.refresh):
+                self.send()
+            else:
+                self.busy = False
+
+    # The first LED from start on which differs from the sent frame (-1 if there is none). Blocks of
+    # a chunk are compared at once, only a changed block is searched LED by LED.
+    def changed(self, start):
+        if self.resend:
+            return start if start < self.leds else -1
+        r, g, b = self.output.r, self.output.g, self.output.b
+        sent_r, sent_g, sent_b = self.sent.r, self.sent.g, self.sent.b
+        for block in range(start, self.leds, self.CHUNK_LEDS):
+            end = min(block + self.CHUNK_LEDS, self.leds)
+            if r[block:end] != sent_r[block:end] or g[block:end] != sent_g[block:end] or b[block:end] != sent_b[block:end]:
+                for index in range(block, end):
+                    if r[index] != sent_r[index] or g[index] != sent_g[index] or b[index] != sent_b[index]:
+                        return index
+        return -1
+
+    # Send the changed LEDs of the pending frame, must be called with the lock held
+    def send(self):
+        self.dirty = False
+        if self.post != None:
+            self.post.process()
+        r, g, b = self.output.r, self.output.g, self.output.b
+
+        # Each packet starts at the first changed LED which is not sent yet. The packets get views of
+        # a full chunk of the buffer, behind the LEDs it is padded with zeros.
+        if self.metrics.enabled:
+            send_start = time.perf_counter()
+        packets = 0
+        index = self.changed(0)
+        while index >= 0:
+            length = min(self.CHUNK_LEDS, self.leds - index)
+            end = index + self.CHUNK_LEDS
+            try:
+                # The strips are wired with green and blue swapped
+                self.led_strip.set_rgb_values(index, length, r[index:end], b[index:end], g[index:end])
+            except (self.error, OSError) as e:
+                # The strip (or the connection) is gone, keep the frame until it is back
+                log.error('LED-Strip ' + self.labels[0][1] + ' send failed: ' + str(getattr(e, 'description', e)))
+                self.missing()
+                self.dirty = True
+                return
+            packets = packets + 1
+            index = self.changed(index + length)
+        if self.metrics.enabled and packets > 0:
+            self.metrics.observe('ledstrips_set_rgb_values_seconds', self.labels, time.perf_counter() - send_start)
+        self.packets_sent = self.packets_sent + packets
+        self.packets_saved = self.packets_saved + (self.leds + self.CHUNK_LEDS - 1) // self.CHUNK_LEDS - packets
+
+        # Nothing has changed, so the strip does not render a new frame
+        if packets == 0:
+            self.busy = False
+            self.frames_skipped = self.frames_skipped + 1
+            return
+        self.busy = True
+        self.sent_time = time.time()
+        self.sent.copy(self.output)
+        self.resend = False
+        self.frames_sent = self.frames_sent + 1
+        self.effect_sent[self.effect] = self.effect_sent.get(self.effect, 0) + 1
+
+    # Send the pending frame and wait until the strip has rendered it (at most timeout seconds), e.g.
+    # before the strip is detached at the end. Returns False if the strip did not render it in time, a
+    # missing strip gets the frame when it is back.
+    def flush(self, timeout):
+        deadline = time.time() + timeout
+        while True:
+            with self.lock:
+                if self.led_strip == None:
+                    return True
+                if self.dirty and (not self.busy or time.time() - self.sent_time >= self.timeout):
+                    self.send()
+                if not self.dirty and not self.busy:
+                    return True
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.001)
+
+    # Frames per second rendered by the strip
+    def fps(self):
+        with self.lock:
+            if len(self.rendered) < 2 or time.time() - self.rendered[-1] > 1:
+                return 0.0
+            return (len(self.rendered) - 1) / (self.rendered[-1] - self.rendered[0])
+
+    # Time in seconds from sending a frame until the strip has rendered it (median and maximum)
+    def latency(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0, 0.0
+        return latencies[len(latencies) // 2], latencies[-1]
+
+    # The counters for the metrics, the frames sent and dropped per effect
+    def collect(self):
+        with self.lock:
+            sent = list(self.effect_sent.items())
+            dropped = list(self.effect_dropped.items())
+        counters = [('ledstrips_frames_sent_total', self.labels + (('effect', effect),), value) for effect, value in sent]
+        counters.extend(('ledstrips_frames_dropped_total', self.labels + (('effect', effect),), value) for effect, value in dropped)
+        counters.extend([('ledstrips_frames_coalesced_total', self.labels, self.frames_coalesced),
+                         ('ledstrips_frames_skipped_total', self.labels, self.frames_skipped),
+                         ('ledstrips_packets_sent_total', self.labels, self.packets_sent),
+                         ('ledstrips_frames_limited_total', self.labels, self.post.limited if self.post != None else 0)])
+        return counters
+
+    def stats(self):
+        return {'fps': self.fps(), 'sent': self.frames_sent, 'dropped': self.frames_dropped, 'coalesced': self.frames_coalesced,
+                'skipped': self.frames_skipped, 'packets': self.packets_sent, 'packets_saved': self.packets_saved,
+                'bytes_saved': self.packets_saved * self.PACKET_BYTES}
+
+# Compositor which maps one canvas onto any number of strips. Each strip shows the segment of the
+# canvas starting at its offset, strips with the same offset show the same LEDs. All segments of a
+# frame are handed to their strips at the same tick of the frame clock, concurrently by a thread pool,
+# and the skew between the first and the last strip is measured.
+class compositor:
+    def __init__(self, uids, offsets, workers):
+        self.uids = uids
+        self.offsets = offsets
+        self.outputs = [None]*len(uids)
+        self.pool = None
+        if workers > 0 and len(uids) > 1:
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='LED-Strips output')
+        self.frames = 0
+        self.skews = collections.deque(maxlen=100)
+
+    # Set (or with None remove) the output stage of the strip with the given number
+    def attach(self, number, output):
+        self.outputs[number] = output
+
+    # Show a part of a canvas frame (starting at index) of an effect (its label) on the selected strips
+    def show(self, index, length, r, g, b, selected, effect=None):
+        segments = []
+        for number in selected:
+            output = self.outputs[number]
+            if output == None:
+                continue
+            offset = self.offsets[number]
+            # The part of the frame which is on this strip
+            start = max(index, offset)
+            end = min(index + length, offset + output.leds)
+            if start < end:
+                segments.append((output, start - offset, end - start, r[start-index:end-index], g[start-index:end-index], b[start-index:end-index],
+                                 effect))
+        if not segments:
+            return
+
+        # All segments belong to the same tick of the frame clock
+        self.frames = self.frames + 1
+        if self.pool == None or len(segments) == 1:
+            times = [self.push(segment) for segment in segments]
+        else:
+            times = list(self.pool.map(self.push, segments))
+        self.skews.append(max(times) - min(times))
+
+    def push(self, segment):
+        output, index, length, r, g, b, effect = segment
+        output.push(index, length, r, g, b, effect)
+        return time.time()
+
+    # Skew in seconds between the first and the last strip of a frame (median and maximum)
+    def skew(self):
+        skews = sorted(self.skews)
+        if not skews:
+            return 0.0, 0.0
+        return skews[len(skews) // 2], skews[-1]
+
+    def close(self):
+        if self.pool != None:
+            self.pool.shutdown()
+
+# Animation files with pre-rendered frames. After a header with the number of LEDs, the frame rate and
+# the channel order follow the frames with one byte per LED and channel. Each frame has three planes,
+# one per channel in the channel order of the header, so a plane can be sent to the strips directly.
+ANIMATION_MAGIC = b'LEDA'
+ANIMATION_VERSION = 1
+ANIMATION_HEADER = struct.Struct('<4sB3sIfI12x')
+
+# Writes an animation file, the number of frames in the header is set when it is closed
+class animation_recorder:
+    def __init__(self, path, leds, fps, channel_order='RGB'):
+        self.leds = leds
+        self.fps = fps
+        self.channel_order = channel_order
+        self.planes = ['RGB'.index(channel) for channel in channel_order]
+        self.canvas = [bytearray(leds), bytearray(leds), bytearray(leds)]
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self.file.write(ANIMATION_HEADER.pack(ANIMATION_MAGIC, ANIMATION_VERSION, channel_order.encode(), leds, fps, 0))
+
+    # Put a part of a frame (starting at index) on the canvas
+    def update(self, index, length, r, g, b):
+        length = min(length, self.leds - index)
+        if length <= 0:
+            return
+        for plane, row in zip(self.canvas, (r, g, b)):
+            plane[index:index+length] = bytes(row[:length])
+
+    # Write the canvas as the next frame(s)
+    def write(self, count=1):
+        frame = b''.join(bytes(self.canvas[plane]) for plane in self.planes)
+        for i in range(count):
+            self.file.write(frame)
+        self.frames = self.frames + count
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(ANIMATION_HEADER.pack(ANIMATION_MAGIC, ANIMATION_VERSION, self.channel_order.encode(), self.leds, self.fps, self.frames))
+        self.file.close()
+
+# Reads an animation file through a memory map, the frames are views into the file without a copy
+class animation_file:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < ANIMATION_HEADER.size:
+            self.map.close()
+            raise ValueError(path + ' is too short for an animation file')
+        magic, version, channel_order, self.leds, self.fps, self.frames = ANIMATION_HEADER.unpack_from(self.map)
+        if magic != ANIMATION_MAGIC or version != ANIMATION_VERSION:
+            self.map.close()
+            raise ValueError(path + ' is no animation file')
+        if self.leds <= 0 or not self.fps > 0:
+            self.map.close()
+            raise ValueError(path + ' has no LEDs or no frame rate')
+        self.channel_order = channel_order.decode()
+        self.frame_size = 3 * self.leds
+        # Never trust the header more than the file size
+        self.frames = min(self.frames, (len(self.map) - ANIMATION_HEADER.size) // self.frame_size)
+        self.view = memoryview(self.map)
+        # Position of the red, green and blue plane in a frame
+        self.offsets = [self.channel_order.index(channel) * self.leds for channel in 'RGB']
+
+    # The red, green and blue plane of a frame
+    def frame(self, number):
+        start = ANIMATION_HEADER.size + number * self.frame_size
+        return [self.view[start+offset:start+offset+self.leds] for offset in self.offsets]
+
+    def close(self):
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # A frame is still in use (e.g. by the traceback of an error), the map is closed with it
+            pass
+
+# An effect or a setting of the rotary poti as a plugin. Its button of the Multi Touch selects its mode,
+# in which the positions of the rotary poti are applied (apply) or restart the effect. Without a mode
+# the button plays the effect at once. With fps the frame rate of the effect is fixed, with 0 the
+# effect keeps its own timing. A stateless effect only depends on its params (attributes of
+# led_strips): its effect renders all frames from the values of the params, the frames are cached
+# under them and each one is shown (show) with the frame rate.
+class effect_plugin:
+    def __init__(self, name, button=None, mode=None, apply=None, effect=None, fps=0, params=(), stateless=False, show=None):
+        self.name = name
+        self.button = button
+        self.mode = mode
+        self.apply = apply
+        self.effect = effect
+        self.fps = fps
+        self.params = params
+        self.stateless = stateless
+        self.show = show
+
+    # The key of the cached frames for the actual parameters
+    def cache_key(self, ledstrips):
+        return (self.name,) + tuple(getattr(ledstrips, param) for param in self.params)
+
+    # The effect with the declared frame rate
+    def frames(self, ledstrips, position):
+        if self.stateless:
+            key = self.cache_key(ledstrips)
+            for frame in ledstrips.cache.get(key, self.effect, ledstrips, *key[1:]):
+                self.show(ledstrips, frame)
+                yield 1 / self.fps
+            return
+        for delay in self.effect(ledstrips, position):
+            yield delay if self.fps == 0 else 1 / self.fps
+
+    # Apply a position of the rotary poti (None without one)
+    def position(self, ledstrips, position):
+        if self.effect != None:
+            ledstrips.renderer.play(self.frames(ledstrips, position), self.name, transition=True)
+        elif self.apply != None:
+            self.apply(ledstrips, position)
+
+    def touch(self, ledstrips):
+        if self.mode != None:
+            ledstrips.MODE = self.mode
+        else:
+            self.position(ledstrips, None)
+
+# Any other action for a button of the Multi Touch, e.g. the selection of the strips
+class button_binding:
+    def __init__(self, name, button, action):
+        self.name = name
+        self.button = button
+        self.action = action
+
+    def touch(self, ledstrips):
+        self.action(ledstrips)
+
+# The plugins by name, mode and button. The built-in PLUGINS and the PLUGINS lists of the given modules
+# are loaded with the first lookup, afterwards each lookup is a table access. A later plugin replaces
+# an earlier one with the same name, mode or button.
+class plugin_registry:
+    BUTTONS = 12
+
+    def __init__(self, modules=()):
+        self.modules = modules
+        self.lock = threading.Lock()
+        self.plugins = None
+        self.modes = None
+        self.buttons = None
+
+    def discover(self):
+        with self.lock:
+            if self.plugins != None:
+                return
+            found = list(PLUGINS)
+            for module in self.modules:
+                try:
+                    found.extend(importlib.import_module(module).PLUGINS)
+                except (ImportError, AttributeError) as e:
+                    log.error('Plugins of ' + module + ' not loaded: ' + str(e))
+            plugins = {}
+            modes = {}
+            buttons = [None]*self.BUTTONS
+            for plugin in found:
+                plugins[plugin.name] = plugin
+                if getattr(plugin, 'mode', None) != None:
+                    modes[plugin.mode] = plugin
+                if plugin.button != None:
+                    buttons[plugin.button] = plugin
+            self.modes = modes
+            self.buttons = buttons
+            self.plugins = plugins
+            log.info('Plugins: ' + ', '.join(plugins))
+
+    def get(self, name):
+        if self.plugins == None:
+            self.discover()
+        return self.plugins[name]
+
+    # The plugin which uses the positions of the rotary poti in the mode
+    def mode(self, mode):
+        if self.plugins == None:
+            self.discover()
+        return self.modes.get(mode)
+
+    def button(self, button):
+        if self.plugins == None:
+            self.discover()
+        return self.buttons[button]
+
+    # All effects by name
+    def effects(self):
+        if self.plugins == None:
+            self.discover()
+        return [plugin for plugin in self.plugins.values() if getattr(plugin, 'effect', None) != None]
+
+# The frame clock of the render processes in shared memory: the time of the first tick and the tick
+# period. All processes render at the same ticks, so the strips of different processes stay in step.
+class shared_clock:
+    HEADER = struct.Struct('<dd')
+
+    # Without a name new shared memory is created, otherwise the existing one is opened
+    def __init__(self, name=None, period=0.02):
+        import multiprocessing.shared_memory
+        if name == None:
+            self.memory = multiprocessing.shared_memory.SharedMemory(create=True, size=self.HEADER.size)
+            self.HEADER.pack_into(self.memory.buf, 0, time.time(), period)
+        else:
+            self.memory = multiprocessing.shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+
+    # The first tick of the frame clock at or after the time
+    def align(self, when):
+        start, period = self.HEADER.unpack_from(self.memory.buf, 0)
+        return start + math.ceil((when - start) / period - 1e-9) * period
+
+    def close(self, unlink=False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+# Coordinator of the render processes for large installations. The strips are grouped by their brickd
+# host and the largest groups are split up until there is one group per process. Each process connects
+# to its host, owns the strips of its group and renders its own frames at the ticks of the shared frame
+# clock. The frames of a process only cover the span of the canvas from the first LED to the last LED of
+# its strips, so the processes share the rendering of the canvas too. The coordinator forwards the calls (and attribute changes) for the inputs to all processes in
+# the same order, so all processes have the same parameters.
+class render_pool:
+    def __init__(self, strips, hosts, processes, period, simulator=None, settings=None):
+        import multiprocessing
+        self.clock = shared_clock(period=period)
+        context = multiprocessing.get_context('spawn')
+        self.results = context.Queue()
+        groups = collections.OrderedDict()
+        for number, (uid, leds, offset) in enumerate(strips):
+            groups.setdefault(hosts[uid], []).append(number)
+        groups = list(groups.items())
+        while len(groups) < processes:
+            host, numbers = max(groups, key=lambda group: len(group[1]))
+            if len(numbers) < 2:
+                break
+            groups.remove((host, numbers))
+            groups.append((host, numbers[:len(numbers)//2]))
+            groups.append((host, numbers[len(numbers)//2:]))
+
+        self.commands = []
+        self.processes = []
+        for (host, port), numbers in groups:
+            commands = context.Queue()
+            # The processes start with the WORKER_SETTINGS of led_strips, only the first one saves the state
+            worker_settings = dict(settings or {})
+            worker_settings['STATE_SAVE'] = worker_settings.get('STATE_SAVE', True) and not self.processes
+            # The offsets of the strips start at the span of the process
+            start = min(strips[number][2] for number in numbers)
+            span = [(uid, leds, offset - start) for uid, leds, offset in [strips[number] for number in numbers]]
+            process = context.Process(target=render_worker, name='LED-Strips render ' + str(len(self.processes)), daemon=True,
+                                      args=(host, port, span, numbers, self.clock.name, start, commands, self.results,
+                                            simulator, worker_settings))
+            process.start()
+            self.commands.append(commands)
+            self.processes.append(process)
+        log.info('Render processes: ' + ', '.join(host + ':' + str(port) + ' ' + str(len(numbers)) + ' strips' for (host, port), numbers in groups))
+
+    # Call the method of led_strips in all processes
+    def call(self, name, *args):
+        for commands in self.commands:
+            commands.put(('call', name, args))
+
+    # Change the attribute of led_strips in all processes
+    def set(self, name, value):
+        for commands in self.commands:
+            commands.put(('set', name, value))
+
+    # Stop the processes, returns the statistics of their strips
+    def close(self, timeout=10):
+        for commands in self.commands:
+            commands.put(None)
+        stats = []
+        for process in self.processes:
+            try:
+                stats.extend(self.results.get(timeout=timeout))
+            except queue.Empty:
+                log.error('Render process did not report its statistics')
+        for process in self.processes:
+            process.join(timeout)
+        self.commands = []
+        self.clock.close(True)
+        return stats
+
+# A render process of the render_pool, runs led_strips for its strips (with the offsets in its span,
+# which starts at the LED start of the canvas) without the inputs. When it is stopped it reports the
+# statistics of its strips.
+def render_worker(host, port, strips, numbers, clock_name, start, commands, results, simulator, settings):
+    for name, value in settings.items():
+        setattr(led_strips, name, value)
+    led_strips.HOST = host
+    led_strips.PORT = port
+    led_strips.PROCESSES = 0
+    clock = shared_clock(clock_name)
+    backend = None
+    if simulator != None:
+        from led_strips_simulator import simulator_backend
+        backend = simulator_backend([uid for uid, strip_leds, offset in strips], simulator)
+    ledstrips = led_strips(backend, strips, numbers, clock, start)
+    try:
+        while True:
+            command = commands.get()
+            if command == None:
+                break
+            kind, name, args = command
+            try:
+                if kind == 'set':
+                    setattr(ledstrips, name, args)
+                else:
+                    getattr(ledstrips, name)(*args)
+            except Exception as e:
+                log.error('Render process ' + host + ': ' + name + ' failed: ' + str(e))
+        ledstrips.renderer.stop()
+        ledstrips.log_stats()
+        results.put([dict(output.stats(), uid=uid) for uid, output in zip(ledstrips.compositor.uids, ledstrips.compositor.outputs)])
+    finally:
+        ledstrips.close()
+        clock.close()
+
+# Pixel frames from lighting consoles and other software over UDP, as Art-Net (ArtDmx) or sACN (E1.31)
+# packets. Each universe carries 170 LEDs of the canvas in RGB order, the first universe the first
+# LEDs. The receive thread writes the packets into one frame. When all universes of the frame are
+# there (or one comes again before, e.g. after a lost packet) it wakes the render thread, which shows
+# the newest frame with its next tick, so the latest frame wins. Packets which are up to 20 behind the
+# last sequence number of their universe are dropped as out of order.
+class network_input(threading.Thread):
+    PIXELS_PER_UNIVERSE = 170
+    ARTNET_ID = b'Art-Net\x00'
+    ARTNET_OP_DMX = 0x5000
+    E131_ID = b'ASC-E1.17\x00\x00\x00'
+    E131_PREVIEW = 0x80
+    E131_TERMINATED = 0x40
+
+    def __init__(self, host, port, protocol, universe, leds, timeout, wake, metrics):
+        threading.Thread.__init__(self, name='LED-Strips network')
+        self.daemon = True
+        self.protocol = protocol
+        self.universe = universe
+        self.universes = (leds + self.PIXELS_PER_UNIVERSE - 1) // self.PIXELS_PER_UNIVERSE
+        self.leds = leds
+        self.timeout = timeout
+        self.wake = wake
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.frame = frame_buffer(leds)
+        self.dirty = False
+        self.received = 0
+        self.last = 0
+        self.sequences = {}
+        # The universes of the frame which came in so far, one bit per universe
+        self.pending = 0
+        self.complete = (1 << self.universes) - 1
+        self.running = True
+        # Statistics
+        self.packets = 0
+        self.dropped = 0
+        self.invalid = 0
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.socket.settimeout(0.5)
+        if protocol == 'e131':
+            # sACN is sent to a multicast group per universe
+            for number in range(universe, universe + self.universes):
+                group = socket.inet_aton('239.255.' + str(number >> 8) + '.' + str(number & 0xff))
+                try:
+                    self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, group + socket.inet_aton('0.0.0.0'))
+                except OSError as e:
+                    log.error('Network universe ' + str(number) + ' multicast failed: ' + str(e))
+
+    # The universe, the sequence number and the DMX data (or None) of an Art-Net packet
+    def parse_artnet(self, packet, size):
+        if size < 18 or packet[0:8] != self.ARTNET_ID or packet[8] | packet[9] << 8 != self.ARTNET_OP_DMX:
+            return None
+        length = min(packet[16] << 8 | packet[17], size - 18)
+        return packet[14] | packet[15] << 8, packet[12], packet[18:18+length]
+
+    # The same for an E1.31 data packet, preview data and terminated streams have no data
+    def parse_e131(self, packet, size):
+        if size < 126 or packet[4:16] != self.E131_ID or packet[43] != 0x02 or packet[117] != 0x02 or packet[125] != 0:
+            return None
+        if packet[112] & self.E131_TERMINATED:
+            self.last = 0
+        if packet[112] & (self.E131_PREVIEW | self.E131_TERMINATED):
+            return None
+        # The property values start with the DMX start code
+        length = min((packet[123] << 8 | packet[124]) - 1, size - 126)
+        return packet[113] << 8 | packet[114], packet[111], packet[126:126+length]
+
+    def run(self):
+        buffer = bytearray(1500)
+        packet = memoryview(buffer)
+        parse = self.parse_e131 if self.protocol == 'e131' else self.parse_artnet
+        while self.running:
+            try:
+                size = self.socket.recv_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            dmx = parse(packet, size)
+            if dmx == None:
+                self.invalid = self.invalid + 1
+                self.metrics.count('ledstrips_network_packets_total', (('result', 'invalid'),))
+                continue
+            universe, sequence, data = dmx
+            if not self.in_order(universe, sequence):
+                self.dropped = self.dropped + 1
+                self.metrics.count('ledstrips_network_packets_total', (('result', 'dropped'),))
+                continue
+            self.packets = self.packets + 1
+            self.metrics.count('ledstrips_network_packets_total', (('result', 'ok'),))
+            # The LEDs of the universe on the canvas
+            index = (universe - self.universe) * self.PIXELS_PER_UNIVERSE
+            length = min(len(data) // 3, self.leds - index)
+            if index < 0 or length <= 0:
+                continue
+            bit = 1 << (universe - self.universe)
+            with self.lock:
+                if self.pending & bit:
+                    # The frame before was not complete, show it with what came in
+                    self.dirty = True
+                    self.pending = 0
+                if self.pending == 0:
+                    self.received = time.time()
+                self.frame.r[index:index+length] = data[0:3*length:3]
+                self.frame.g[index:index+length] = data[1:3*length:3]
+                self.frame.b[index:index+length] = data[2:3*length:3]
+                self.pending = self.pending | bit
+                if self.pending == self.complete:
+                    self.dirty = True
+                    self.pending = 0
+                dirty = self.dirty
+                self.last = time.time()
+            if dirty:
+                self.wake()
+        self.socket.close()
+
+    # Whether the sequence number is not older than the last one of the universe (0 turns the check
+    # off for Art-Net)
+    def in_order(self, universe, sequence):
+        last = self.sequences.get(universe)
+        if last != None and (sequence != 0 or self.protocol == 'e131'):
+            difference = (sequence - last) & 0xff
+            if difference >= 128:
+                difference = difference - 256
+            if -20 < difference <= 0:
+                return False
+        self.sequences[universe] = sequence
+        return True
+
+    # Whether a new frame has come in since the last call, the frame is read with the lock held
+    def take(self):
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = False
+            return dirty
+
+    # Frames are coming in
+    def active(self):
+        return time.time() - self.last < self.timeout
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+# Sends frames as Art-Net or E1.31 packets, e.g. to test the network input from the same machine
+class network_sender:
+    def __init__(self, host, port, protocol='artnet', universe=None, source='LED-Strips'):
+        self.address = (host, port)
+        self.protocol = protocol
+        self.universe = universe if universe != None else (1 if protocol == 'e131' else 0)
+        self.source = source.encode()[:63]
+        self.cid = os.urandom(16)
+        self.sequence = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def packet(self, universe, data):
+        if self.protocol == 'e131':
+            return (struct.pack('>HH12sH', 0x0010, 0x0000, network_input.E131_ID, 0x7000 | (110 + len(data))) +
+                    struct.pack('>I16s', 0x00000004, self.cid) +
+                    struct.pack('>HI64sBHBBH', 0x7000 | (88 + len(data)), 0x00000002, self.source, 100, 0, self.sequence, 0, universe) +
+                    struct.pack('>HBBHHHB', 0x7000 | (11 + len(data)), 0x02, 0xa1, 0, 1, len(data) + 1, 0) + data)
+        # Art-Net wants an even number of channels
+        if len(data) % 2:
+            data = data + b'\x00'
+        return network_input.ARTNET_ID + struct.pack('<HBBBBH', network_input.ARTNET_OP_DMX, 0, 14, self.sequence, 0, universe) + struct.pack('>H', len(data)) + data
+
+    # Send a frame (red, green and blue values of the LEDs) in as many universes as needed
+    def send(self, r, g, b):
+        self.sequence = self.sequence % 255 + 1
+        data = bytes(value for rgb in zip(r, g, b) for value in rgb)
+        step = 3 * network_input.PIXELS_PER_UNIVERSE
+        for number, start in enumerate(range(0, len(data), step)):
+            self.socket.sendto(self.packet(self.universe + number, data[start:start+step]), self.address)
+
+    def close(self):
+        self.socket.close()
+
+# Audio for the audio-reactive mode: PCM from a WAV file, a raw file, a pipe or stdin ('-'). Raw PCM is
+# signed 16 bit little endian. fps times per second the newest window of samples is analysed with a
+# Hann window and an FFT into bands with logarithmic spacing from 40 Hz to 16 kHz. The band levels
+# (0-1) are relative to the loudest band over the last seconds, so quiet and loud music both fill the
+# range. After each analysis it wakes the render thread, which shows the newest levels with its next
+# tick, so the latest analysis wins. Files are read in real time, pipes as the samples come in. The
+# FFT needs NumPy.
+class audio_input(threading.Thread):
+    MIN_FREQUENCY = 40
+    MAX_FREQUENCY = 16000
+    # Levels span this range in dB below the peak, which falls by DECAY dB per second
+    RANGE = 50
+    DECAY = 6
+
+    def __init__(self, source, rate, channels, fps, window, bands, wake, metrics):
+        threading.Thread.__init__(self, name='LED-Strips audio')
+        self.daemon = True
+        self.source = source
+        self.rate = rate
+        self.channels = channels
+        self.fps = fps
+        self.window = window
+        self.bands = bands
+        self.wake = wake
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.levels = [0.0] * bands
+        self.dirty = False
+        # When the samples of the newest levels were there
+        self.received = 0
+        self.peak = None
+        self.running = True
+        # Statistics
+        self.analyses = 0
+        self.analysis_times = collections.deque(maxlen=1000)
+        self.delays = collections.deque(maxlen=1000)
+
+    # Open the source, returns the stream, the sample type and whether it is read in real time
+    def open(self):
+        import wave
+        if self.source == '-':
+            stream = sys.stdin.buffer
+        else:
+            stream = open(self.source, 'rb')
+        realtime = self.source != '-' and os.path.isfile(self.source)
+        if stream.peek(12)[:4] == b'RIFF':
+            audio = wave.open(stream)
+            if audio.getsampwidth() not in (1, 2, 4):
+                raise ValueError('Unsupported sample width: ' + str(audio.getsampwidth() * 8) + ' bit')
+            self.rate = audio.getframerate()
+            self.channels = audio.getnchannels()
+            sample_type = {1: np.uint8, 2: np.int16, 4: np.int32}[audio.getsampwidth()]
+            return audio, sample_type, realtime
+        return stream, np.int16, realtime
+
+    def prepare(self):
+        hop = max(1, self.rate // self.fps)
+        self.window = max(self.window, hop)
+        self.samples = np.zeros(self.window)
+        self.hann = np.hanning(self.window)
+        # The FFT bins of the bands, each band has at least one bin
+        frequencies = np.fft.rfftfreq(self.window, 1 / self.rate)
+        edges = np.geomspace(self.MIN_FREQUENCY, min(self.MAX_FREQUENCY, self.rate / 2), self.bands + 1)
+        bins = [int(edge) for edge in np.searchsorted(frequencies, edges)]
+        for number in range(1, len(bins)):
+            bins[number] = max(bins[number], bins[number - 1] + 1)
+        self.bins = np.array(bins[:-1])
+        self.end = min(bins[-1], len(frequencies))
+        self.counts = np.diff(bins[:self.bands] + [self.end])
+        return hop
+
+    # Analyse the window after the new samples (in the range -1 to 1) are added
+    def analyse(self, samples):
+        count = len(samples)
+        if count >= self.window:
+            self.samples[:] = samples[-self.window:]
+        else:
+            self.samples[:-count] = self.samples[count:]
+            self.samples[-count:] = samples
+        spectrum = np.fft.rfft(self.samples * self.hann)
+        power = spectrum.real * spectrum.real + spectrum.imag * spectrum.imag
+        bands = np.add.reduceat(power[:self.end], self.bins) / self.counts
+        levels = 10 * np.log10(bands + 1e-12)
+        loudest = float(levels.max())
+        self.peak = loudest if self.peak == None else max(loudest, self.peak - self.DECAY / self.fps)
+        return np.clip((levels - (self.peak - self.RANGE)) / self.RANGE, 0, 1).tolist()
+
+    def run(self):
+        if np is None:
+            log.error('Audio input needs NumPy')
+            return
+        try:
+            stream, sample_type, realtime = self.open()
+        except (OSError, EOFError, ValueError) as e:
+            log.error('Audio input ' + self.source + ' failed: ' + str(e))
+            return
+        hop = self.prepare()
+        read = stream.readframes if hasattr(stream, 'readframes') else lambda frames: stream.read(frames * self.channels * 2)
+        size = np.dtype(sample_type).itemsize * self.channels
+        offset = 128 if sample_type == np.uint8 else 0
+        scale = 1 / (np.iinfo(sample_type).max + 1 - offset)
+        start = time.time()
+        hops = 0
+        try:
+            while self.running:
+                if realtime:
+                    # The samples of a file are there when they would have been played
+                    time.sleep(max(0, start + (hops + 1) * hop / self.rate - time.time()))
+                data = read(hop)
+                data = data[:len(data) - len(data) % size]
+                if not data:
+                    break
+                hops = hops + 1
+                received = time.time()
+                samples = np.frombuffer(data, sample_type).reshape(-1, self.channels).mean(axis=1)
+                levels = self.analyse((samples - offset) * scale)
+                self.analysis_times.append(time.time() - received)
+                self.analyses = self.analyses + 1
+                self.metrics.count('ledstrips_audio_analyses_total')
+                with self.lock:
+                    self.levels = levels
+                    self.received = received
+                    self.dirty = True
+                self.wake()
+        finally:
+            if self.source != '-':
+                stream.close()
+        # The sound is over, the LEDs go dark
+        with self.lock:
+            self.levels = [0.0] * self.bands
+            self.received = time.time()
+            self.dirty = True
+        self.wake()
+
+    # The newest levels and when their samples were there, None if there are no new ones
+    def take(self):
+        with self.lock:
+            if not self.dirty:
+                return None, None
+            self.dirty = False
+            self.delays.append(time.time() - self.received)
+            return self.levels, self.received
+
+    def stop(self):
+        self.running = False
+        # Reading stdin or a pipe may block until the next samples
+        self.join(1)
+
+# Connects to brickd and enumerates the devices in the background, so startup does not wait for brickd
+# and no callback blocks. A failed attempt is repeated after an exponential backoff with jitter.
+class connection_manager(threading.Thread):
+    def __init__(self, ipcon, host, port, error, backoff_min, backoff_max, metrics):
+        threading.Thread.__init__(self, name='LED-Strips connection')
+        self.daemon = True
+        self.ipcon = ipcon
+        self.host = host
+        self.port = port
+        self.error = error
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.metrics = metrics
+        self.condition = threading.Condition()
+        self.enumerate_pending = True
+        self.running = True
+        self.failures = 0
+
+    # Enumerate (again) as soon as possible, e.g. after a reconnect
+    def enumerate(self):
+        with self.condition:
+            self.enumerate_pending = True
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def run(self):
+        backoff = self.backoff_min
+        while True:
+            with self.condition:
+                if not self.running:
+                    break
+                enumerate_pending = self.enumerate_pending
+                self.enumerate_pending = False
+            try:
+                # A connection which is lost later on is restored by the auto reconnect of the IP Connection
+                if self.ipcon.get_connection_state() == self.ipcon.CONNECTION_STATE_DISCONNECTED:
+                    self.ipcon.connect(self.host, self.port)
+                    log.info('Connected to ' + self.host + ':' + str(self.port) + '.')
+                if enumerate_pending:
+                    self.ipcon.enumerate()
+                backoff = self.backoff_min
+                timeout = None
+            except (self.error, OSError) as e:
+                # OSError covers the socket errors of connect
+                log.error('Connection error: ' + str(getattr(e, 'description', e)))
+                self.failures = self.failures + 1
+                self.metrics.count('ledstrips_connection_failures_total')
+                with self.condition:
+                    self.enumerate_pending = self.enumerate_pending or enumerate_pending
+                timeout = backoff * random.uniform(0.5, 1.5)
+                backoff = min(backoff * 2, self.backoff_max)
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or (timeout == None and self.enumerate_pending), timeout)
+
+# The state of the inputs (mode, strips, positions of the rotary poti and active LEDs) as a small JSON
+# snapshot, so it survives a restart. A change is saved when no other change came in for delay
+# seconds, so turning the rotary poti writes the file once. The snapshot is written to a temporary
+# file which replaces the old one, a crash leaves either the old or the new snapshot.
+class state_store(threading.Thread):
+    FIELDS = ('MODE', 'MODE_STRIPS', 'POSITION_HUE', 'POSITION_SATURATION', 'POSITION_VALUE', 'POSITION_VELOCITY', 'ACTIVE_LEDS')
+
+    def __init__(self, path, delay, metrics):
+        threading.Thread.__init__(self, name='LED-Strips state')
+        self.daemon = True
+        self.path = os.path.expanduser(path)
+        self.delay = delay
+        self.metrics = metrics
+        self.condition = threading.Condition()
+        # The snapshot which is not saved yet, the time of its last change and the saved one
+        self.pending = None
+        self.changed = 0
+        self.saved = None
+        self.running = True
+        self.writes = 0
+
+    # The saved snapshot, only the known fields with numbers
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            log.error('State not loaded from ' + self.path + ': ' + str(e))
+            return {}
+        if not isinstance(state, dict):
+            return {}
+        state = dict((name, value) for name, value in state.items()
+                     if name in self.FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool))
+        self.saved = state
+        return state
+
+    # Remember a snapshot, it is saved after the delay
+    def update(self, state):
+        with self.condition:
+            if self.pending == None and state == self.saved:
+                return
+            self.pending = state
+            self.changed = time.time()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and (self.pending == None or time.time() < self.changed + self.delay):
+                    self.condition.wait(None if self.pending == None else self.changed + self.delay - time.time())
+                if not self.running:
+                    break
+                state = self.pending
+                self.pending = None
+            self.write(state)
+
+    def write(self, state):
+        if state == self.saved:
+            return
+        temporary = self.path + '.tmp'
+        try:
+            with open(temporary, 'w') as f:
+                json.dump(state, f, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+        except OSError as e:
+            log.error('State not saved to ' + self.path + ': ' + str(e))
+            return
+        self.saved = state
+        self.writes = self.writes + 1
+        self.metrics.count('ledstrips_state_writes_total')
+
+    # Stop the thread and save a snapshot which is still waiting for its delay
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
+        with self.condition:
+            state = self.pending
+            self.pending = None
+        if state != None:
+            self.write(state)
+
+# Device backend with the Tinkerforge bindings, it provides the classes used by led_strips. They are imported
+# on first use, so the start does not wait for the modules of bricklets which are not used (yet).
+class tinkerforge_backend:
+    # The module of each class
+    MODULES = {'IPConnection': 'tinkerforge.ip_connection',
+               'Error': 'tinkerforge.ip_connection',
+               'LEDStrip': 'tinkerforge.bricklet_led_strip',
+               'MultiTouch': 'tinkerforge.bricklet_multi_touch',
+               'RotaryPoti': 'tinkerforge.bricklet_rotary_poti'}
+
+    # Only called for a class which is not imported yet
+    def __getattr__(self, name):
+        if name not in self.MODULES:
+            raise AttributeError(name)
+        value = getattr(importlib.import_module(self.MODULES[name]), name)
+        setattr(self, name, value)
+        return value
 
 # Class for the two LED-Strips and the multi-touch bricklet with rotary poti
 class led_strips:
     HOST = "localhost"
     PORT = 4223
 
-    UID_LED_STRIP_ONE = "jGy"
-    UID_LED_STRIP_TWO = "jHE"
+    # The LED strips by UID with their number of LEDs and the offset of their segment on the canvas.
+    # All effects are rendered for the whole canvas. The first strip is the left one, the second
+    # strip the right one. With the same offset both strips show the same LEDs.
+    STRIPS = [("jGy", 16, 0),
+              ("jHE", 16, 0)]
+
+    # While brickd is not reachable the connection is retried after a backoff which doubles from
+    # CONNECT_BACKOFF_MIN up to CONNECT_BACKOFF_MAX seconds. Frames for a missing strip are kept
+    # ('buffer', the newest frame is sent when the strip is back) or dropped ('drop').
+    CONNECT_BACKOFF_MIN = 0.5
+    CONNECT_BACKOFF_MAX = 30
+    MISSING_STRIP_POLICY = 'buffer'
+
+    # Threads which send the segments of a frame to the strips concurrently (0 = one after the other)
+    OUTPUT_WORKERS = 4
+
+    # Post-processing of the frames of each strip, all of it is off by default: GAMMA corrects the
+    # brightness (1 = off, about 2.2 makes low values step less but darkens the colors), MAX_CURRENT
+    # is the budget in mA of the power supply of a strip (0 = no limit) with LED_CURRENT mA per color
+    # at full brightness and LED_IDLE_CURRENT mA per LED. DITHERING spreads the fractions of the
+    # corrected values over the frames for smooth fades, the strips then get frames all the time.
+    GAMMA = 1
+    MAX_CURRENT = 0
+    LED_CURRENT = 20
+    LED_IDLE_CURRENT = 1
+    DITHERING = False
+
+    # For large installations the strips are driven by PROCESSES render processes (0 = all in this
+    # process). Strips of another brickd than HOST:PORT are given by UID with their (host, port).
+    PROCESSES = 0
+    STRIP_HOSTS = {}
+    # The settings which the render processes take over from the coordinator. The inputs (network,
+    # audio, metrics endpoint and rotary poti) stay with the coordinator.
+    WORKER_SETTINGS = ('CONNECT_BACKOFF_MIN', 'CONNECT_BACKOFF_MAX', 'MISSING_STRIP_POLICY', 'OUTPUT_WORKERS',
+                       'GAMMA', 'MAX_CURRENT', 'LED_CURRENT', 'LED_IDLE_CURRENT', 'DITHERING', 'FRAME_DURATION',
+                       'FLUSH_TIMEOUT', 'FRAME_CACHE_SIZE', 'METRICS_LOG_INTERVAL', 'PLUGIN_MODULES', 'STATE_FILE',
+                       'STATE_DELAY', 'STATE_SAVE', 'TRANSITION_DURATION', 'TRANSITION_CURVE', 'TRANSITION_EDGE')
+
+    # Time in ms the strips take for one frame, the frame rate follows the strips
+    FRAME_DURATION = 20
+    # At the end the strips get this many seconds to render the last frame
+    FLUSH_TIMEOUT = 0.5
+
+    # A new effect or mode fades in over TRANSITION_DURATION seconds (0 = off) while the old one keeps
+    # running, with the TRANSITION_CURVE 'linear', 'eased' or 'wipe' (along the strips with an edge of
+    # TRANSITION_EDGE times the strip length)
+    TRANSITION_DURATION = 0.5
+    TRANSITION_CURVE = 'eased'
+    TRANSITION_EDGE = 0.1
+
+    # The rotary poti reports its position every POTI_PERIOD ms while it is turned. With a
+    # POTI_THRESHOLD > 0 it only reports a position which moved that far, so an idle knob is quiet.
+    # POTI_SMOOTHING (0-1) smooths the position over the render ticks, changes smaller than
+    # POTI_HYSTERESIS are ignored.
+    POTI_PERIOD = 50
+    POTI_THRESHOLD = 0
+    POTI_SMOOTHING = 0
+    POTI_HYSTERESIS = 0
+
+    # Metrics for Prometheus on http://localhost:METRICS_PORT/metrics and/or written to the log
+    # every METRICS_LOG_INTERVAL seconds (0 = off, without both the metrics are disabled)
+    METRICS_PORT = 0
+    METRICS_LOG_INTERVAL = 0
+
+    # Memory in bytes for the precomputed frames of the periodic effects
+    FRAME_CACHE_SIZE = 16*1024*1024
+
+    # Frames from the network on NETWORK_PORT (0 = off, Art-Net uses 6454, E1.31 5568) as 'artnet' or
+    # 'e131' packets. The canvas starts with NETWORK_UNIVERSE (None = 0 for Art-Net, 1 for E1.31). The
+    # network frames have priority over the effects until no frame came in for NETWORK_TIMEOUT seconds.
+    NETWORK_HOST = ''
+    NETWORK_PORT = 0
+    NETWORK_PROTOCOL = 'artnet'
+    NETWORK_UNIVERSE = None
+    NETWORK_TIMEOUT = 2.5
+
+    # Audio for the audio-reactive mode (MODE_AUDIO) from AUDIO_SOURCE: a WAV file, a raw file, a pipe or
+    # '-' for stdin ('' = off). Raw PCM is signed 16 bit little endian with AUDIO_RATE and AUDIO_CHANNELS.
+    # AUDIO_FPS times per second the last AUDIO_WINDOW samples are analysed in AUDIO_BANDS frequency
+    # bands. AUDIO_GAIN (set by the rotary poti in the mode) scales the loudness and the bass.
+    AUDIO_SOURCE = ''
+    AUDIO_RATE = 44100
+    AUDIO_CHANNELS = 2
+    AUDIO_FPS = 40
+    AUDIO_WINDOW = 2048
+    AUDIO_BANDS = 12
+    AUDIO_GAIN = 1.0
+
+    # Modules with a PLUGINS list of further effects and button bindings
+    PLUGIN_MODULES = []
+
+    # The mode, the strips, the positions and the active LEDs are saved in STATE_FILE ('' = off) when
+    # they did not change for STATE_DELAY seconds and restored at the start. With STATE_SAVE = False
+    # they are only restored. DEMO plays the initial show at the start.
+    STATE_FILE = ''
+    STATE_DELAY = 1.0
+    STATE_SAVE = True
+    DEMO = False
 
     MODE = 0
     MODE_HUE = 1
@@ -33,6 +1881,7 @@ class led_strips:
     MODE_COLOR_RANDOMLY = 8
     MODE_LEDS = 9
     MODE_OFF = 10
+    MODE_AUDIO = 11
 
     MODE_STRIPS = 0
     MODE_LEFT_STRIP = 1
@@ -44,107 +1893,297 @@ class led_strips:
     POSITION_VALUE = 0.3
     POSITION_VELOCITY = 1
 
-    R = [255]*16
-    G = [0]*16
-    B = [0]*16
-    
     MAX_LEDS = 16
     ACTIVE_LEDS = 16
 
+    color = None
     ipcon = None
-    led_strip_1 = None
-    led_strip_2 = None
+    connection = None
+    disconnected_at = None
+    backend = None
+    metrics = None
+    compositor = None
     multi_touch = None
     rotary_poti = None
+    renderer = None
+    cache = None
+    recorder = None
+    network = None
+    audio = None
+    pool = None
+    clock = None
+    start = 0
+    plugins = None
+    state = None
+    shown = None
+    layer = None
+    direct_layer = None
+    poti = None
+    poti_armed = None
 
-    def __init__(self):
-        # Create IP Connection
-        self.ipcon = IPConnection()
-        while True:
-            try:
-                self.ipcon.connect(led_strips.HOST, led_strips.PORT)
-                break
-            except Error as e:
-                log.error('Connection error: ' + str(e.description))
-                time.sleep(1)
-            except socket.error as e:
-                log.error('Socket error: ' + str(e))
-                time.sleep(1)
+    # The backend is the Tinkerforge bindings by default, strips can replace the STRIPS setting. A render
+    # process gets the numbers of its strips in the STRIPS of the coordinator, the shared frame clock and
+    # the LED of the canvas where its span starts (start), and leaves the inputs to the coordinator.
+    def __init__(self, backend=None, strips=None, numbers=None, clock=None, start=0):
+        self.backend = backend if backend != None else tinkerforge_backend()
+        if strips != None:
+            self.STRIPS = strips
+        self.clock = clock
+        numbers = numbers if numbers != None else list(range(len(self.STRIPS)))
+        # The strips of the MODE_STRIPS
+        self.selections = {self.MODE_LEFT_STRIP: [number for number, strip in enumerate(numbers) if strip == 0],
+                           self.MODE_RIGHT_STRIP: [number for number, strip in enumerate(numbers) if strip == 1],
+                           self.MODE_BOTH_STRIPS: list(range(len(numbers)))}
 
-        # Register IP Connection callbacks
-        self.ipcon.register_callback(IPConnection.CALLBACK_ENUMERATE, self.cb_enumerate)
-        self.ipcon.register_callback(IPConnection.CALLBACK_CONNECTED, self.cb_connected)
+        # The frames cover the canvas up to the last LED of the strips, in a render process its span
+        self.MAX_LEDS = max(offset + leds for uid, leds, offset in self.STRIPS)
+        self.start = start
+        self.ACTIVE_LEDS = self.MAX_LEDS
+        # The color of the last one colored frame, the other effects start with it
+        self.color = frame_buffer(self.MAX_LEDS)
+        self.color.fill(255, 0, 0)
+        # The effects which change the LEDs of one frame render into it in place, each frame goes to the
+        # strips (or into the frames of a transition) right away
+        self.frame = frame_buffer(self.MAX_LEDS)
+        # The last frame which was shown, the transitions start with it
+        if self.TRANSITION_DURATION > 0:
+            self.shown = frame_buffer(self.MAX_LEDS)
 
-        while True:
-            try:
-                self.ipcon.enumerate()
-                break
-            except Error as e:
-                log.error('Enumerate error: ' + str(e.description))
-                time.sleep(1)
+        self.plugins = plugin_registry(self.PLUGIN_MODULES)
+
+        self.metrics = metrics_registry()
+        if self.METRICS_PORT > 0:
+            self.metrics.serve(self.METRICS_PORT)
+        if self.METRICS_LOG_INTERVAL > 0:
+            self.metrics.log_periodically(self.METRICS_LOG_INTERVAL)
+        self.metrics.collectors.append(self.collect_metrics)
+
+        self.cache = frame_cache(self.FRAME_CACHE_SIZE)
+        self.compositor = compositor([uid for uid, leds, offset in self.STRIPS], [offset for uid, leds, offset in self.STRIPS], self.OUTPUT_WORKERS)
+        # The output stages exist from the start, the strips are attached when they are enumerated
+        post = None
+        if self.GAMMA != 1 or self.MAX_CURRENT > 0 or self.DITHERING:
+            post = {'gamma': self.GAMMA, 'max_current': self.MAX_CURRENT, 'led_current': self.LED_CURRENT,
+                    'idle_current': self.LED_IDLE_CURRENT, 'dithering': self.DITHERING}
+        for number, (uid, leds, offset) in enumerate(self.STRIPS):
+            self.compositor.attach(number, strip_output(None, self.FRAME_DURATION, leds, uid, self.metrics,
+                                                        self.MISSING_STRIP_POLICY, post, self.backend.Error))
+
+        self.poti = poti_input(self.POTI_SMOOTHING, self.POTI_HYSTERESIS)
+
+        # Start the render thread, all effects are running there
+        self.renderer = render_thread(self.tick, self.FRAME_DURATION / 1000, self.metrics, clock.align if clock != None else None,
+                                      self.effect_transition if self.TRANSITION_DURATION > 0 else None)
+        self.renderer.start()
+
+        # The last state is restored before the first frame, render processes restore and save it themselves
+        if self.STATE_FILE and self.PROCESSES == 0:
+            self.state = state_store(self.STATE_FILE, self.STATE_DELAY, self.metrics)
+            self.restore_state(self.state.load())
+            if self.STATE_SAVE:
+                self.state.start()
+            else:
+                self.state = None
+
+        # The render processes own the strips, this process only handles the inputs
+        if self.PROCESSES > 0:
+            hosts = dict((uid, self.STRIP_HOSTS.get(uid, (self.HOST, self.PORT))) for uid, leds, offset in self.STRIPS)
+            settings = dict((name, getattr(led_strips, name)) for name in self.WORKER_SETTINGS)
+            # With the simulator (it has a latency) the processes simulate their strips too
+            self.pool = render_pool(self.STRIPS, hosts, self.PROCESSES, self.FRAME_DURATION / 1000,
+                                    getattr(self.backend, 'latency', None), settings)
+
+        if self.NETWORK_PORT > 0 and self.pool != None:
+            log.error('Network input is not available with render processes')
+        elif self.NETWORK_PORT > 0:
+            universe = self.NETWORK_UNIVERSE if self.NETWORK_UNIVERSE != None else (1 if self.NETWORK_PROTOCOL == 'e131' else 0)
+            self.network = network_input(self.NETWORK_HOST, self.NETWORK_PORT, self.NETWORK_PROTOCOL, universe, self.MAX_LEDS,
+                                         self.NETWORK_TIMEOUT, self.renderer.wake, self.metrics)
+            self.network.start()
+
+        if self.AUDIO_SOURCE and self.pool != None:
+            log.error('Audio input is not available with render processes')
+        elif self.AUDIO_SOURCE:
+            self.audio = audio_input(self.AUDIO_SOURCE, self.AUDIO_RATE, self.AUDIO_CHANNELS, self.AUDIO_FPS, self.AUDIO_WINDOW,
+                                     self.AUDIO_BANDS, self.renderer.wake, self.metrics)
+            self.audio.start()
+
+        # Create IP Connection and register IP Connection callbacks
+        self.ipcon = self.backend.IPConnection()
+        self.ipcon.register_callback(self.ipcon.CALLBACK_ENUMERATE, self.cb_enumerate)
+        self.ipcon.register_callback(self.ipcon.CALLBACK_CONNECTED, self.cb_connected)
+        self.ipcon.register_callback(self.ipcon.CALLBACK_DISCONNECTED, self.cb_disconnected)
+
+        # Connect and enumerate in the background, until then everything runs without the devices
+        self.connection = connection_manager(self.ipcon, self.HOST, self.PORT, self.backend.Error,
+                                             self.CONNECT_BACKOFF_MIN, self.CONNECT_BACKOFF_MAX, self.metrics)
+        self.connection.start()
 
     # Callback handels device connections and configures possibly lost configuration
     def cb_enumerate(self, uid, connected_uid, position, hardware_version, firmware_version, device_identifier, enumeration_type):
-        if enumeration_type == IPConnection.ENUMERATION_TYPE_CONNECTED or enumeration_type == IPConnection.ENUMERATION_TYPE_AVAILABLE:
-            if device_identifier == LEDStrip.DEVICE_IDENTIFIER and uid == self.UID_LED_STRIP_ONE: #LED-Strip 1
-                try:
-                    self.led_strip_1 = LEDStrip(uid, self.ipcon)
-                    log.info('LED-Strip 1 initialized.')
-                except Error as e:
-                    log.error('LED-Strip 1 init failed: ' + str(e.description))
-                    self.led_strip_1 = None
-            elif device_identifier == LEDStrip.DEVICE_IDENTIFIER and uid == self.UID_LED_STRIP_TWO: #LED-Strip 2
+        if enumeration_type == self.ipcon.ENUMERATION_TYPE_CONNECTED or enumeration_type == self.ipcon.ENUMERATION_TYPE_AVAILABLE:
+            if device_identifier == self.backend.LEDStrip.DEVICE_IDENTIFIER and uid in self.compositor.uids and self.pool == None: # LED-Strips
+                number = self.compositor.uids.index(uid)
                 try:
-                    self.led_strip_2 = LEDStrip(uid, self.ipcon)
-                    log.info('LED-Strip 2 initialized.')
-                except Error as e:
-                    log.error('LED-Strip 2 init failed: ' + str(e.description))
-                    self.led_strip_2 = None
-            elif device_identifier == MultiTouch.DEVICE_IDENTIFIER: # MulitTouch for changing colors etc.
+                    led_strip = self.backend.LEDStrip(uid, self.ipcon)
+                    # A strip which is (back) there gets its configuration and the newest frame
+                    self.compositor.outputs[number].attach(led_strip)
+                    log.info('LED-Strip ' + uid + ' initialized.')
+                except self.backend.Error as e:
+                    log.error('LED-Strip ' + uid + ' init failed: ' + str(e.description))
+                    self.compositor.outputs[number].detach()
+            elif device_identifier == self.backend.MultiTouch.DEVICE_IDENTIFIER and self.clock == None: # MulitTouch for changing colors etc.
                 try:
-                    self.multi_touch = MultiTouch(uid, self.ipcon)
+                    self.multi_touch = self.backend.MultiTouch(uid, self.ipcon)
                     self.multi_touch.register_callback(self.multi_touch.CALLBACK_TOUCH_STATE, self.cb_buttons)
                     self.multi_touch.set_electrode_config(0x0FFF)
                     self.multi_touch.recalibrate()
                     log.info('Set proximity off.')
                     log.info('Multi-Touch initialized.')
-                except Error as e:
+                except self.backend.Error as e:
                     log.error('Multi-Touch init failed: ' + str(e.description))
                     self.multi_touch = None
-            elif device_identifier == RotaryPoti.DEVICE_IDENTIFIER: # Rotary Poti for picking a color or changing the saturation
+            elif device_identifier == self.backend.RotaryPoti.DEVICE_IDENTIFIER and self.clock == None: # Rotary Poti for picking a color or changing the saturation
                 try:
-                    self.rotary_poti = RotaryPoti(uid, self.ipcon)
+                    self.rotary_poti = self.backend.RotaryPoti(uid, self.ipcon)
                     self.rotary_poti.register_callback(self.rotary_poti.CALLBACK_POSITION, self.cb_position)
-                    self.rotary_poti.set_position_callback_period(50)
+                    if self.POTI_THRESHOLD > 0:
+                        # Only a position which left the threshold around the last one triggers a callback
+                        self.rotary_poti.register_callback(self.rotary_poti.CALLBACK_POSITION_REACHED, self.cb_position)
+                        self.rotary_poti.set_debounce_period(self.POTI_PERIOD)
+                        self.arm_poti_threshold(self.rotary_poti.get_position())
+                    else:
+                        self.rotary_poti.set_position_callback_period(self.POTI_PERIOD)
                     log.info('Rotary Poti initialized.')
-                except Error as e:
+                except self.backend.Error as e:
                     log.error('Rotary Poti init failed: ' + str(e.description))
                     self.rotary_poti = None
+        elif enumeration_type == self.ipcon.ENUMERATION_TYPE_DISCONNECTED:
+            if uid in self.compositor.uids:
+                self.compositor.outputs[self.compositor.uids.index(uid)].detach()
+                log.info('LED-Strip ' + uid + ' disconnected.')
 
     # Callback handels reconnection of IP Connection
     def cb_connected(self, connected_reason):
-        if connected_reason == IPConnection.CONNECT_REASON_AUTO_RECONNECT:
+        if connected_reason == self.ipcon.CONNECT_REASON_AUTO_RECONNECT:
             log.info('Auto reconnect.')
-            while True:
-                try:
-                    self.ipcon.enumerate()
-                    break
-                except Error as e:
-                    log.error('Enumerate error:' + str(e.description))
-                    time.sleep(1)
+            self.metrics.count('ledstrips_reconnects_total')
+            if self.disconnected_at != None:
+                self.metrics.observe('ledstrips_reconnect_seconds', (), time.time() - self.disconnected_at)
+                self.disconnected_at = None
+            # The connection manager enumerates, so this callback does not block
+            self.connection.enumerate()
 
-    # Check which mode is set: the left LED strip, the right LED strip or both LED strips
+    # Callback for a lost connection, all strips are missing until they are enumerated again
+    def cb_disconnected(self, disconnect_reason):
+        log.info('Connection lost.')
+        self.disconnected_at = time.time()
+        for output in self.compositor.outputs:
+            output.detach()
+
+    # Check which mode is set: the left LED strip, the right LED strip or all LED strips
     def set_mode(self, mode, i, leds, r, b, g):
-        if self.MODE_STRIPS == self.MODE_BOTH_STRIPS:
-            self.led_strip_1.set_rgb_values(i, leds, r, b, g)
-            self.led_strip_2.set_rgb_values(i, leds, r, b, g)
-        elif self.MODE_STRIPS == self.MODE_LEFT_STRIP:
-            self.led_strip_1.set_rgb_values(i, leds, r, b, g)
-        elif self.MODE_STRIPS == self.MODE_RIGHT_STRIP:
-            self.led_strip_2.set_rgb_values(i, leds, r, b, g)
+        # The frames of the transitions only have the LEDs of the canvas, e.g. an animation can be longer
+        canvas_leds = max(0, min(leds, self.MAX_LEDS - i))
+        # During a transition the effects render into the frames which are blended
+        layer = self.layer if self.layer != None else self.direct_layer
+        if layer != None:
+            layer.write(i, canvas_leds, r, g, b)
+            return
+        # While recording an animation nothing goes to the strips
+        if self.recorder != None:
+            self.recorder.update(i, leds, r, g, b)
+            return
+        selected = self.selections.get(self.MODE_STRIPS)
+        if selected == None:
+            return
+        if self.shown != None:
+            self.shown.write(i, canvas_leds, r, g, b)
+        self.compositor.show(i, leds, r, g, b, selected, self.renderer.rendering() if self.renderer != None else None)
+
+    # Log the frame rate and the dropped and coalesced frames of the strips
+    def log_stats(self):
+        for uid, output in zip(self.compositor.uids, self.compositor.outputs):
+            if output != None:
+                log.info('LED-Strip ' + uid + ': {fps:.1f} fps, {sent} sent, {dropped} dropped, {coalesced} coalesced, {skipped} skipped, '
+                         '{packets} packets, {packets_saved} packets and {bytes_saved} bytes saved'.format(**output.stats()))
+        log.info('Strip skew: {0:.2f} ms median, {1:.2f} ms max'.format(*[skew*1000 for skew in self.compositor.skew()]))
+        log.info('Frame cache: {hit_rate:.0%} hits, {entries} effects, {bytes} bytes'.format(**self.cache.stats()))
+        log.info('Rotary Poti: ' + str(self.poti.events) + ' positions, ' + str(self.poti.applied) + ' applied')
+        if self.audio != None:
+            log.info('Audio: ' + str(self.audio.analyses) + ' analyses')
+
+    # The counters of the strips and the frame cache for the metrics
+    def collect_metrics(self):
+        counters = []
+        for output in self.compositor.outputs:
+            if output != None:
+                counters.extend(output.collect())
+        cache = self.cache.stats()
+        counters.append(('ledstrips_cache_hits_total', (), cache['hits']))
+        counters.append(('ledstrips_cache_misses_total', (), cache['misses']))
+        counters.append(('ledstrips_poti_positions_total', (), self.poti.events))
+        return counters
+
+    # Save the state, stop the render thread and the output threads and disconnect
+    def close(self):
+        if self.state != None:
+            self.state.stop()
+        if self.pool != None:
+            self.pool.close()
+            self.pool = None
+        if self.network != None:
+            self.network.stop()
+        if self.audio != None:
+            self.audio.stop()
+        self.connection.stop()
+        self.renderer.stop()
+        # The last frame (e.g. all LEDs off) still has to reach the strips
+        for output in self.compositor.outputs:
+            if not output.flush(self.FLUSH_TIMEOUT):
+                log.error('LED-Strip ' + output.labels[0][1] + ' did not render the last frame')
+        self.compositor.close()
+        self.metrics.close()
+        # Nothing is sent anymore, also not for a frame rendered callback which is still queued
+        for output in self.compositor.outputs:
+            output.detach()
+        if self.ipcon != None:
+            self.ipcon.disconnect()
     
+    # Set the saved state and show it: the effect of the MODE or the color of the positions
+    def restore_state(self, state):
+        if not state:
+            return
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.ACTIVE_LEDS = max(0, min(int(self.ACTIVE_LEDS), self.MAX_LEDS))
+        log.info('State restored from ' + self.state.path)
+        r, g, b = colorsys.hsv_to_rgb(self.POSITION_HUE, self.POSITION_SATURATION, self.POSITION_VALUE)
+        frame = frame_solid(int(r*255), int(g*255), int(b*255), self.ACTIVE_LEDS, self.MAX_LEDS)
+        plugin = self.plugins.mode(self.MODE)
+        if getattr(plugin, 'effect', None) != None:
+            # The effect starts with the color, like after the color was set, and without a transition
+            self.color.write(0, self.MAX_LEDS, frame[0], frame[1], frame[2])
+            self.renderer.play(plugin.frames(self, None), plugin.name)
+        else:
+            self.show_color_frame(frame)
+
+    # Save the state after a change of the inputs
+    def save_state(self):
+        if self.state != None:
+            self.state.update(dict((name, getattr(self, name)) for name in state_store.FIELDS))
+
+    # Select the strips for the following frames (MODE_*_STRIP)
+    def select_strips(self, mode):
+        self.MODE_STRIPS = mode
+        if self.pool != None:
+            self.pool.set('MODE_STRIPS', mode)
+
     # Turn off the LED strips depending on the given mode
     def leds_off(self):
+        if self.pool != None:
+            self.pool.call('leds_off')
+            return
         r = [0]*self.MAX_LEDS
         g = [0]*self.MAX_LEDS
         b = [0]*self.MAX_LEDS
@@ -169,6 +2208,14 @@ class led_strips:
         b = [255]*self.MAX_LEDS
         self.set_mode(self.MODE_STRIPS, 0, self.MAX_LEDS, r, b, g)
 
+    # Send a frame rendered by the frame_* functions to the strips
+    def show_frame(self, frame):
+        self.set_mode(self.MODE, 0, self.MAX_LEDS, frame[0], frame[2], frame[1])
+
+    # Send a frame_buffer with all LEDs to the strips
+    def show_buffer(self, frame):
+        self.set_mode(self.MODE, 0, self.MAX_LEDS, frame.r, frame.b, frame.g)
+
     # Match the hue (color) to the position by the rotary poti.
     def set_hue(self, position):
         # The position returned by the rotary poti (o to +300) must be mapped to 0°-360° in the HSV colorspace
@@ -179,8 +2226,9 @@ class led_strips:
         #print('Hue: {0:.1f}'.format(hue),'Saturation: {0:.2f}'.format(self.POSITION_SATURATION),'Value: {0:.2f}'.format(self.POSITION_VALUE))
         # Build the LED strip
         self.build_led_strip(r, g, b) 
-        # Save the value in the variable
+        # Save the value in the variable, the precomputed frames are outdated now
         self.POSITION_HUE = hue/360
+        self.cache.invalidate()
 
     # Match the saturation to the position by the rotary poti.
     def set_saturation(self, position):
@@ -191,8 +2239,9 @@ class led_strips:
         #print('Hue: {0:.1f}'.format(self.POSITION_HUE*360),'Saturation: {0:.2f}'.format(saturation),'Value: {0:.2f}'.format(self.POSITION_VALUE))
         # Build the LED strip
         self.build_led_strip(r, g, b)
-        # Save the value in the variable
+        # Save the value in the variable, the precomputed frames are outdated now
         self.POSITION_SATURATION = saturation
+        self.cache.invalidate()
     
     # Match the value to the position by the rotary poti.
     def set_value(self, position):
@@ -203,8 +2252,9 @@ class led_strips:
         #print('Hue: {0:.1f}'.format(self.POSITION_HUE*360),'Saturation: {0:.2f}'.format(self.POSITION_SATURATION),'Value: {0:.2f}'.format(value))
         # Build the LED strip
         self.build_led_strip(r, g, b)
-        # Save the value in the variable
+        # Save the value in the variable, the precomputed frames are outdated now
         self.POSITION_VALUE = value
+        self.cache.invalidate()
 
     # NOT USED AT THE MOMENT
     # The veolcity for some functions can be adjusted by the rotary poti.
@@ -216,115 +2266,75 @@ class led_strips:
 
     # Function to generate a rainbow gradient. Can be adjusted by the velocity.
     def set_color_gradient(self, position):
+        self.plugins.get('gradient').position(self, position)
+
+    def effect_color_gradient(self, position):
+        return self.plugins.get('gradient').frames(self, position)
+
+    def render_color_gradient(self, saturation, value, max_leds):
         # use all LEDs for the gradient
-        active_leds = self.MAX_LEDS
-        loop_counter = 0
-        r = []
-        g = []
-        b = []
-        for led in list(range(active_leds)):
-            rv, gv, bv = colorsys.hsv_to_rgb(1.*led/active_leds, self.POSITION_SATURATION, self.POSITION_VALUE)
-            r.append(int(rv*255))
-            g.append(int(gv*255))
-            b.append(int(bv*255))
+        active_leds = max_leds
+        frame = frame_hsv(hue_ramp(active_leds), saturation, value)
+        frames = []
         for leds in range(active_leds):
-            #print("Loop counter: " + str(loop_counter))
-            first_red = r.pop(0)
-            r.append(first_red)
-            first_green = g.pop(0)
-            g.append(first_green)
-            first_blue = b.pop(0)
-            b.append(first_blue)
-            #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-            self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)
-            loop_counter = loop_counter + 1            
-            time.sleep(0.075)
+            # Move every color one LED to the front, the first one goes to the end
+            frame = frame_roll(frame, -1)
+            frames.append(frame)
+        return frames
 
     # Fade and change the color for the whole strip
     def set_color_gradient_fading(self):
+        self.plugins.get('gradient_fading').position(self, None)
+
+    def effect_color_gradient_fading(self):
+        return self.plugins.get('gradient_fading').frames(self, None)
+
+    def render_color_gradient_fading(self, saturation, active_leds, max_leds):
+        frames = []
         # Outer loop for changing the color
         for hue in range(0, 360, 30):
             hue = (hue / 360)
             #print("Hue: " + str(hue))
             # Inner loop for fading the actual color
-            for value in range(1, 21):
-                value = value / 20
-                #print("Value: " + str(value))
-                r, g, b = colorsys.hsv_to_rgb(hue, self.POSITION_SATURATION, value)
-                self.build_led_strip(r, g, b)
-                time.sleep(0.075)
-            for value in reversed(range(1, 21)):
-                value = value / 20
-                #print("Value: " + str(value))
-                r, g, b = colorsys.hsv_to_rgb(hue, self.POSITION_SATURATION, value)
-                self.build_led_strip(r, g, b)
-                time.sleep(0.075)
+            frames.extend(self.render_color_fading(hue, saturation, active_leds, max_leds))
+        return frames
  
     # The LEDs are fading from 0.1 to 1.0 in the value space. The fading can be adjusted by the velocity.
     def set_color_fading(self, position):
-        loop_counter = 0
-        while loop_counter < 5:
-            #print("Loop counter: " + str(loop_counter))
-            for value in range(1, 21):
-                value = value / 20
-                #print("Value: " + str(value))
-                r, g, b = colorsys.hsv_to_rgb(self.POSITION_HUE, self.POSITION_SATURATION, value)
-                self.build_led_strip(r, g, b)
-                time.sleep(0.075)
-            for value in reversed(range(1, 21)):
-                value = value / 20
-                #print("Value: " + str(value))
-                r, g, b = colorsys.hsv_to_rgb(self.POSITION_HUE, self.POSITION_SATURATION, value)
-                self.build_led_strip(r, g, b)
-                time.sleep(0.075)
-                loop_counter = loop_counter + 1
+        self.plugins.get('fading').position(self, position)
+
+    def effect_color_fading(self, position):
+        return self.plugins.get('fading').frames(self, position)
+
+    def render_color_fading(self, hue, saturation, active_leds, max_leds):
+        frames = []
+        for value in list(range(1, 21)) + list(reversed(range(1, 21))):
+            value = value / 20
+            #print("Value: " + str(value))
+            r, g, b = colorsys.hsv_to_rgb(hue, saturation, value)
+            frames.append(frame_solid(int(r*255), int(g*255), int(b*255), active_leds, max_leds))
+        return frames
 
     # Only one LED is active and moves from one end to the other end of the strip.
     def set_color_dot(self, position):
-        # Build the initial array
-        r = self.R[0]
-        g = self.G[0]
-        b = self.B[0]
-        r = [r]
-        g = [g]
-        b = [b]
-        r.extend([0]*15)
-        g.extend([0]*15)
-        b.extend([0]*15)
-        #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-        # Now get the dot moving
-        i = 0
-        while i < 15:
-            dot_r = r[i]
-            dot_g = g[i]
-            dot_b = b[i]
-            r[i] = 0
-            g[i] = 0
-            b[i] = 0
-            r[i+1] = dot_r
-            g[i+1] = dot_g
-            b[i+1] = dot_b
-            #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-            i = i + 1
-            self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)
-            time.sleep(0.1)
-        while i > 0:
-            dot_r = r[i]
-            dot_g = g[i]
-            dot_b = b[i]
-            r[i] = 0
-            g[i] = 0
-            b[i] = 0
-            r[i-1] = dot_r
-            g[i-1] = dot_g
-            b[i-1] = dot_b
-            #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-            i = i - 1
-            self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)
-            time.sleep(0.1)
+        self.plugins.get('dot').position(self, position)
+
+    def effect_color_dot(self, position):
+        # The dot has the color of the first LED
+        r = self.color.r[0]
+        g = self.color.g[0]
+        b = self.color.b[0]
+        # Now get the dot moving from the first LED to the last one and back
+        for i in itertools.chain(range(1, self.MAX_LEDS), reversed(range(self.MAX_LEDS-1))):
+            self.frame.dot(r, g, b, i)
+            self.show_buffer(self.frame)
+            yield 0.1
 
     # Build random color values and place them randomly on the strips.
     def set_color_randomly(self, position):
+        self.plugins.get('randomly').position(self, position)
+
+    def effect_color_randomly(self, position):
         active_leds = self.ACTIVE_LEDS
         """
         r = []
@@ -353,23 +2363,16 @@ class led_strips:
             time.sleep(0.075)
         """
         # 3. Variant
+        hues = hue_ramp(active_leds)
         for leds in range(active_leds):
-            r = []
-            g = []
-            b = []
             range_leds = list(range(active_leds))
             random.shuffle(range_leds)
             #print("LEDs: " + str(range_leds))
-            for led in range_leds:
-                rv, gv, bv = colorsys.hsv_to_rgb(1.*led/active_leds, self.POSITION_SATURATION, self.POSITION_VALUE)
-                r.append(int(rv*255))
-                g.append(int(gv*255))
-                b.append(int(bv*255))
-            #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-            self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)
-            time.sleep(0.1)
+            frame = frame_hsv([hues[led] for led in range_leds], self.POSITION_SATURATION, self.POSITION_VALUE)
+            self.show_frame(frame_pad(frame, self.MAX_LEDS))
+            yield 0.1
 
-    # Extend the LEDs from 1 LED to 16 LEDs per strip. Like the fading, but here the LEDs can be adjusted by the rotary poti.
+    # Extend the LEDs from 1 LED to all LEDs per strip. Like the fading, but here the LEDs can be adjusted by the rotary poti.
     def set_leds(self, position):
         # The rotary poti can set the number of LEDs which should be used
         active_leds = (position / 300) * self.MAX_LEDS
@@ -377,31 +2380,179 @@ class led_strips:
         #print('Active LEDs: ' + str(active_leds))
         
         # Get the color values from the variables
-        r = self.R[0]
-        g = self.G[0]
-        b = self.B[0]
+        r = self.color.r[0]
+        g = self.color.g[0]
+        b = self.color.b[0]
         #print('R: ' + str(r),'G: ' + str(g),'B: ' + str(b))
 
-        # Now build the list with the active leds
-        r = [r]*active_leds
-        g = [g]*active_leds
-        b = [b]*active_leds
-        #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-
-        # Now add the remaining dark leds to the list
-        dark_leds = 16 - active_leds
-        #print('Dark LEDs: ' + str(dark_leds))
-        r.extend([0]*dark_leds)
-        g.extend([0]*dark_leds)
-        b.extend([0]*dark_leds)          
-        #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
+        # Now build the frame with the active leds, the remaining leds are dark
+        self.frame.solid(r, g, b, active_leds)
 
         # Now get it to the strips
-        self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)           
+        self.show_buffer(self.frame)
 
         # Save the value in the variable
         self.ACTIVE_LEDS = active_leds
 
+    # The audio-reactive mode shows the levels of the audio bands like a level meter: the loudness is the
+    # number of LEDs, the bass raises the brightness (up to POSITION_VALUE) and the higher bands move the
+    # hue from POSITION_HUE
+    def show_audio(self, levels, received):
+        self.metrics.observe('ledstrips_callback_delay_seconds', (('callback', 'audio'),), time.time() - received)
+        bands = len(levels)
+        total = sum(levels)
+        loudness = min(1.0, total / bands * self.AUDIO_GAIN)
+        # The weighted mean of the bands, 0 for the lowest and 1 for the highest one
+        centroid = sum(band * level for band, level in enumerate(levels)) / total / max(bands - 1, 1) if total > 0 else 0.0
+        bass_bands = max(1, bands // 4)
+        bass = min(1.0, sum(levels[:bass_bands]) / bass_bands * self.AUDIO_GAIN)
+        value = max(loudness, bass) * self.POSITION_VALUE
+        r, g, b = colorsys.hsv_to_rgb((self.POSITION_HUE + centroid * 2 / 3) % 1, self.POSITION_SATURATION, value)
+        frame = frame_solid(int(r*255), int(g*255), int(b*255), int(math.ceil(loudness * self.MAX_LEDS)), self.MAX_LEDS)
+        self.show_frame(frame)
+        return frame
+
+    # The rotary poti sets the gain of the audio-reactive mode (0-2)
+    def set_audio_gain(self, position):
+        self.AUDIO_GAIN = position / 150
+
+    # Play an animation file with the frame rate of the file
+    def set_animation(self, path, loop=False):
+        if self.pool != None:
+            self.pool.call('set_animation', path, loop)
+            return
+        self.renderer.play(self.effect_animation(path, loop), 'animation')
+
+    def effect_animation(self, path, loop):
+        animation = animation_file(path)
+        r = g = b = None
+        try:
+            while True:
+                for number in range(animation.frames):
+                    r, g, b = animation.frame(number)
+                    # The animation covers the whole canvas, a render process shows its span of it
+                    if self.start > 0:
+                        r, g, b = r[self.start:], g[self.start:], b[self.start:]
+                    self.set_mode(self.MODE, 0, max(0, animation.leds - self.start), r, b, g)
+                    yield 1 / animation.fps
+                if not loop:
+                    break
+        finally:
+            # The views must be gone before the file can be closed
+            r = g = b = None
+            animation.close()
+
+    # Record an effect into an animation file with a constant frame rate. Each frame of the effect is
+    # repeated until the next one is due, so the timing of the effect stays the same.
+    def record(self, effect, path, fps, channel_order='RGB'):
+        recorder = animation_recorder(path, self.MAX_LEDS, fps, channel_order)
+        self.recorder = recorder
+        try:
+            elapsed = 0.0
+            for delay in effect:
+                elapsed = elapsed + delay
+                count = round(elapsed * fps) - recorder.frames
+                if count > 0:
+                    recorder.write(count)
+        finally:
+            self.recorder = None
+            recorder.close()
+        return recorder.frames
+
+    # Play the effect of a plugin, optionally with another frame rate and over and over again
+    def play(self, name, position=None, fps=None, loop=False):
+        if self.pool != None:
+            self.pool.call('play', name, position, fps, loop)
+            return
+        plugin = self.plugins.get(name)
+        def frames():
+            while True:
+                for delay in plugin.frames(self, position):
+                    yield delay if fps == None else 1 / fps
+                if not loop:
+                    break
+        self.renderer.play(frames(), name)
+
+    def play_demo(self):
+        if self.pool != None:
+            self.pool.call('play_demo')
+            return
+        self.renderer.play(self.effect_demo())
+
+    # The initial show at startup: dot twice, fading twice and then the LEDs off
+    def effect_demo(self):
+        yield from self.effect_color_dot(100)
+        yield from self.effect_color_dot(100)
+        yield from self.effect_color_fading(100)
+        yield from self.effect_color_fading(100)
+        self.leds_off()
+        yield 0
+
+    # Transition from the outgoing to the incoming effect (either can be None). Both go on at their own
+    # pace into their own frame, which start with the last frame shown. Frames which are shown directly
+    # (e.g. the color of the rotary poti) go to the incoming frame. Every frame duration the blend of
+    # both is shown, afterwards the incoming effect runs by itself.
+    def effect_transition(self, outgoing, incoming):
+        blend = frame_blend(self.MAX_LEDS, self.TRANSITION_CURVE, self.TRANSITION_EDGE)
+        blend.outgoing.copy(self.shown)
+        blend.incoming.copy(self.shown)
+        # Where the blended frames go, a transition can also become the outgoing effect of the next one,
+        # so the layer is read again with every frame. Only the transition to the strips at its start
+        # takes the frames which are shown directly.
+        layer = self.layer
+        if layer == None:
+            self.direct_layer = blend.incoming
+        effects = [outgoing, incoming]
+        frames = [blend.outgoing, blend.incoming]
+        start = time.time()
+        due = [start, start]
+        period = self.FRAME_DURATION / 1000
+        progress = 0
+        try:
+            while True:
+                layer = self.layer
+                now = time.time()
+                for number in range(2):
+                    if effects[number] == None or now < due[number]:
+                        continue
+                    self.layer = frames[number]
+                    try:
+                        delay = next(effects[number])
+                        # Keep the pace of the effect, but do not try to catch up if it is late
+                        due[number] = max(due[number] + delay, now)
+                    except StopIteration:
+                        effects[number] = None
+                    finally:
+                        self.layer = layer
+                progress = (now - start) / self.TRANSITION_DURATION
+                if progress >= 1:
+                    break
+                blend.blend(progress)
+                self.show_blend(layer, blend.output)
+                yield min([period, start + self.TRANSITION_DURATION - now] + [due[number] - now for number in range(2) if effects[number] != None])
+        finally:
+            self.layer = layer
+            if self.direct_layer is blend.incoming:
+                self.direct_layer = None
+            if effects[0] != None:
+                effects[0].close()
+            if effects[1] != None and progress < 1:
+                effects[1].close()
+        self.show_blend(layer, blend.incoming)
+        if effects[1] != None:
+            yield max(due[1] - time.time(), 0)
+            yield from effects[1]
+
+    # Show a frame of a transition in the layer of the transition around it or on the strips
+    def show_blend(self, layer, frame):
+        direct_layer = self.direct_layer
+        self.direct_layer = None
+        self.layer = layer
+        try:
+            self.set_mode(self.MODE, 0, self.MAX_LEDS, frame.r, frame.b, frame.g)
+        finally:
+            self.direct_layer = direct_layer
+
     # Helper function to generate the output for the LED strips
     def build_led_strip(self, r, g, b):
         r = int(r*255)
@@ -409,25 +2560,18 @@ class led_strips:
         b = int(b*255)
         #print('R: ' + str(r),'G: ' + str(g),'B: ' + str(b))
 
-        # Get the actual number of LEDs which should be used
-        active_leds = self.ACTIVE_LEDS
-        r = [r]*active_leds
-        g = [g]*active_leds
-        b = [b]*active_leds
+        # Only the actual number of LEDs is used, the remaining leds are dark
+        self.frame.solid(r, g, b, self.ACTIVE_LEDS)
         
-        # Now add the remaining dark leds to the list
-        dark_leds = 16 - active_leds
-        r.extend([0]*dark_leds)
-        g.extend([0]*dark_leds)
-        b.extend([0]*dark_leds)
-        #print('R: ' + str(r) + '\n','G: ' + str(g) + '\n','B: ' + str(b) + '\n')
-        
-        # Now get it to the strips
-        self.set_mode(self.MODE, 0, self.MAX_LEDS, r, b, g)
-        # Save the values in the variables
-        self.R = r
-        self.G = g
-        self.B = b
+        # Now get it to the strips and save the values in the color buffer
+        self.show_buffer(self.frame)
+        self.color.copy(self.frame)
+
+    # Send a frame in one color to the strips and remember the color for the other effects
+    def show_color_frame(self, frame):
+        self.show_frame(frame)
+        # Save the values in the color buffer
+        self.color.write(0, self.MAX_LEDS, frame[0], frame[1], frame[2])
 
     # Callback function for position callback (parameter has range -150 to 150)
     def cb_position(self, position):
@@ -435,81 +2579,229 @@ class led_strips:
         #print('Position: ' + str(position))
         # Always add +150 to the position value so that it will start on the left by 0 and to the right it will end by 300
         position = position + 150
-        # Select in which MODE it is called
-        if self.MODE == self.MODE_HUE:
-            self.set_hue(position)
-        elif self.MODE == self.MODE_SATURATION:
-            self.set_saturation(position)
-        elif self.MODE == self.MODE_VALUE:
-            self.set_value(position)
-        elif self.MODE == self.MODE_VELOCITY:
-            self.set_velocity(position)
-        elif self.MODE == self.MODE_COLOR_GRADIENT:
-            self.set_color_gradient(position)
-        elif self.MODE == self.MODE_COLOR_DOT:
-            self.set_color_dot(position)
-        elif self.MODE == self.MODE_COLOR_FADING:
-            self.set_color_fading(position)
-        elif self.MODE == self.MODE_COLOR_RANDOMLY:
-            self.set_color_randomly(position)
-        elif self.MODE == self.MODE_LEDS:
-            self.set_leds(position)
+        # Only remember the position, the render thread applies the newest one with its next tick
+        self.poti.update(position)
+        self.renderer.wake()
+
+    # Called by the render thread before each frame, applies the newest position of the rotary poti
+    def tick(self):
+        # Frames from the network have priority over the effects while they are coming in
+        if self.network != None and self.network.take():
+            self.renderer.cancel()
+            # The frames go to the strips right away, also when a transition was running
+            self.direct_layer = None
+            with self.network.lock:
+                self.metrics.observe('ledstrips_callback_delay_seconds', (('callback', 'network'),), time.time() - self.network.received)
+                frame = self.network.frame
+                self.set_mode(self.MODE, 0, self.MAX_LEDS, frame.r, frame.b, frame.g)
+        # The newest audio levels in the audio-reactive mode
+        if self.audio != None and self.MODE == self.MODE_AUDIO and (self.network == None or not self.network.active()):
+            levels, received = self.audio.take()
+            if levels != None:
+                self.show_audio(levels, received)
+        position, moving = self.poti.take()
+        if position is not None and (self.network == None or not self.network.active()):
+            self.metrics.observe('ledstrips_callback_delay_seconds', (('callback', 'position'),), self.poti.delay)
+            self.apply_position(position)
+        # Move the threshold of the rotary poti to the newest position
+        latest = self.poti.latest
+        if self.POTI_THRESHOLD > 0 and latest is not None and latest != self.poti_armed:
+            try:
+                self.arm_poti_threshold(latest - 150)
+            except self.backend.Error as e:
+                log.error('Rotary Poti threshold failed: ' + str(e.description))
+        return moving
+
+    # Set the threshold of the rotary poti around the position (range -150 to 150)
+    def arm_poti_threshold(self, position):
+        self.rotary_poti.set_position_callback_threshold('o', position - self.POTI_THRESHOLD, position + self.POTI_THRESHOLD)
+        self.poti_armed = position + 150
+
+    # The plugin of the MODE uses the position, with render processes they all get the position
+    def apply_position(self, position):
+        if self.pool != None:
+            self.pool.call('apply_position', position)
+            return
+        plugin = self.plugins.mode(self.MODE)
+        if plugin != None:
+            plugin.position(self, position)
+        self.save_state()
 
     # Callback function for button callback
     def cb_buttons(self, button_state):
-        for i in range(12):
-            if button_state & (1 << i):
-                if i == 0:
-                    self.MODE_STRIPS = self.MODE_LEFT_STRIP
-                elif i == 1:
-                    self.MODE = self.MODE_HUE
-                elif i == 2:
-                    self.MODE = self.MODE_COLOR_GRADIENT
-                elif i == 3:
-                    self.MODE_STRIPS = self.MODE_BOTH_STRIPS
-                elif i == 4:
-                    self.MODE = self.MODE_SATURATION
-                elif i == 5:
-                    self.set_color_gradient_fading()
-                elif i == 6:
-                    self.MODE_STRIPS = self.MODE_RIGHT_STRIP
-                elif i == 7:
-                    self.MODE = self.MODE_VALUE
-                elif i == 8:
-                    self.MODE = self.MODE_COLOR_FADING
-                elif i == 9:
-                    #self.MODE = self.MODE_OFF
-                    self.MODE = self.MODE_COLOR_RANDOMLY
-                elif i == 10:
-                    self.MODE = self.MODE_LEDS
-                elif i == 11:
-                    self.MODE = self.MODE_COLOR_DOT
+        if self.pool != None:
+            self.pool.call('cb_buttons', button_state)
+            return
+        mode = self.MODE
+        # Only the touched buttons are looked up, from the lowest to the highest one
+        while button_state:
+            button = (button_state & -button_state).bit_length() - 1
+            button_state = button_state & (button_state - 1)
+            plugin = self.plugins.button(button)
+            if plugin != None:
+                plugin.touch(self)
+        # A mode change fades out the running effect (or stops it before its next frame)
+        if self.MODE != mode:
+            self.renderer.cancel(transition=True)
+        self.save_state()
+
+# The built-in effects, settings of the rotary poti and button bindings
+PLUGINS = [button_binding('left', 0, lambda ledstrips: setattr(ledstrips, 'MODE_STRIPS', led_strips.MODE_LEFT_STRIP)),
+           button_binding('both', 3, lambda ledstrips: setattr(ledstrips, 'MODE_STRIPS', led_strips.MODE_BOTH_STRIPS)),
+           button_binding('right', 6, lambda ledstrips: setattr(ledstrips, 'MODE_STRIPS', led_strips.MODE_RIGHT_STRIP)),
+           effect_plugin('hue', 1, led_strips.MODE_HUE, apply=led_strips.set_hue),
+           effect_plugin('saturation', 4, led_strips.MODE_SATURATION, apply=led_strips.set_saturation),
+           effect_plugin('value', 7, led_strips.MODE_VALUE, apply=led_strips.set_value),
+           effect_plugin('velocity', None, led_strips.MODE_VELOCITY, apply=led_strips.set_velocity),
+           effect_plugin('leds', 10, led_strips.MODE_LEDS, apply=led_strips.set_leds),
+           effect_plugin('audio', None, led_strips.MODE_AUDIO, apply=led_strips.set_audio_gain),
+           effect_plugin('gradient', 2, led_strips.MODE_COLOR_GRADIENT, effect=led_strips.render_color_gradient, fps=1/0.075,
+                         params=('POSITION_SATURATION', 'POSITION_VALUE', 'MAX_LEDS'), stateless=True, show=led_strips.show_frame),
+           effect_plugin('gradient_fading', 5, effect=led_strips.render_color_gradient_fading, fps=1/0.075,
+                         params=('POSITION_SATURATION', 'ACTIVE_LEDS', 'MAX_LEDS'), stateless=True, show=led_strips.show_color_frame),
+           effect_plugin('fading', 8, led_strips.MODE_COLOR_FADING, effect=led_strips.render_color_fading, fps=1/0.075,
+                         params=('POSITION_HUE', 'POSITION_SATURATION', 'ACTIVE_LEDS', 'MAX_LEDS'), stateless=True,
+                         show=led_strips.show_color_frame),
+           effect_plugin('dot', 11, led_strips.MODE_COLOR_DOT, effect=led_strips.effect_color_dot, fps=10),
+           effect_plugin('randomly', 9, led_strips.MODE_COLOR_RANDOMLY, effect=led_strips.effect_color_randomly, fps=10)]
+
+# All effects by name
+EFFECTS = [(plugin.name, lambda ledstrips, plugin=plugin: plugin.frames(ledstrips, 100)) for plugin in PLUGINS if getattr(plugin, 'effect', None) != None]
 
 # Main function
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='LED-Strips with Multi-Touch and Rotary Poti')
+    parser.add_argument('--benchmark', action='store_true', help='measure the frame update latency against the strip length')
+    parser.add_argument('--benchmark-effects', action='store_true', help='benchmark all effects on simulated strips, no hardware needed')
+    parser.add_argument('--benchmark-allocations', action='store_true', help='check that the output stage retains nothing and allocates a constant amount per frame')
+    parser.add_argument('--benchmark-processes', type=int, nargs='+', metavar='PROCESSES', help='measure the throughput with these numbers of render processes')
+    parser.add_argument('--strips', type=int, default=16, help='number of simulated strips (with the longest --lengths) for --benchmark-processes')
+    parser.add_argument('--processes', type=int, default=led_strips.PROCESSES, help='render processes for the strips (0 = all in this process)')
+    parser.add_argument('--benchmark-network', action='store_true', help='measure frame rate and latency of the network input with a local sender')
+    parser.add_argument('--network-port', type=int, default=led_strips.NETWORK_PORT, help='receive Art-Net or E1.31 frames on this UDP port')
+    parser.add_argument('--network-protocol', choices=['artnet', 'e131'], default=led_strips.NETWORK_PROTOCOL, help='protocol of the network frames')
+    parser.add_argument('--benchmark-post', action='store_true', help='measure the time of the post-processing per frame')
+    parser.add_argument('--benchmark-audio', nargs='?', const='', metavar='WAV', help='measure the latency of the audio-reactive mode with a WAV file (a generated one without)')
+    parser.add_argument('--audio', metavar='SOURCE', default=led_strips.AUDIO_SOURCE, help="start in the audio-reactive mode with a WAV or raw PCM file, a pipe or '-' for stdin")
+    parser.add_argument('--benchmark-transitions', action='store_true', help='check the time of the transition blend per frame')
+    parser.add_argument('--benchmark-startup', action='store_true', help='check the time to the first frame against the target')
+    parser.add_argument('--time-to-first-frame', action='store_true', help='start with simulated strips and print the time to the first frame')
+    parser.add_argument('--state-file', help="save and restore the state in this file ('' = off, default ~/.led-strips.json, off with the simulator and the benchmarks)")
+    parser.add_argument('--demo', action='store_true', default=led_strips.DEMO, help='play the initial show at the start')
+    parser.add_argument('--lengths', type=int, nargs='+', default=[16, 50, 150, 300], help='strip lengths for the benchmarks')
+    parser.add_argument('--simulator', action='store_true', help='simulate brickd and the bricklets instead of connecting to them')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated round trip of a request in seconds')
+    parser.add_argument('--record', nargs=2, metavar=('EFFECT', 'FILE'), help='record an effect (' + ', '.join(name for name, effect in EFFECTS) + ') into an animation file')
+    parser.add_argument('--fps', type=float, default=40, help='frame rate of the recorded animation')
+    parser.add_argument('--play', metavar='FILE', help='play an animation file in a loop')
+    parser.add_argument('--metrics-port', type=int, default=led_strips.METRICS_PORT, help='serve Prometheus metrics on this port')
+    parser.add_argument('--metrics-log', type=float, default=led_strips.METRICS_LOG_INTERVAL, help='log the metrics every n seconds')
+    args = parser.parse_args()
+    led_strips.METRICS_PORT = args.metrics_port
+    led_strips.METRICS_LOG_INTERVAL = args.metrics_log
+    led_strips.PROCESSES = args.processes
+    led_strips.NETWORK_PORT = args.network_port
+    led_strips.NETWORK_PROTOCOL = args.network_protocol
+    led_strips.AUDIO_SOURCE = args.audio
+    # The simulator and the benchmarks do not touch the state of the installation, unless a file is given
+    if args.state_file != None:
+        led_strips.STATE_FILE = args.state_file
+    elif not (args.simulator or args.time_to_first_frame or args.benchmark or args.benchmark_effects or args.benchmark_network
+              or args.benchmark_processes or args.benchmark_post or args.benchmark_allocations or args.benchmark_audio != None
+              or args.benchmark_transitions or args.benchmark_startup or args.record):
+        led_strips.STATE_FILE = os.path.join('~', '.led-strips.json')
+
+    # The benchmarks with the classes of this script
+    if (args.benchmark or args.benchmark_effects or args.benchmark_network or args.benchmark_processes or args.benchmark_post
+            or args.benchmark_allocations or args.benchmark_audio != None or args.benchmark_transitions or args.benchmark_startup
+            or args.time_to_first_frame):
+        import led_strips_benchmarks as benchmarks
+        benchmarks.use(sys.modules[__name__])
+
+    if args.benchmark_effects:
+        results = benchmarks.benchmark_effects(args.lengths, args.latency)
+        sys.exit(0 if all(result['passed'] for result in results) else 1)
+
+    if args.benchmark_network:
+        benchmarks.benchmark_network(args.lengths, args.network_protocol, latency=args.latency)
+        sys.exit(0)
+
+    if args.benchmark_processes:
+        benchmarks.benchmark_processes(args.benchmark_processes, args.strips, max(args.lengths), latency=args.latency)
+        sys.exit(0)
+
+    if args.benchmark_post:
+        benchmarks.benchmark_post_processing(args.lengths)
+        sys.exit(0)
+
+    if args.benchmark_allocations:
+        sys.exit(0 if benchmarks.benchmark_allocations(args.lengths) else 1)
+
+    if args.benchmark_audio != None:
+        sys.exit(0 if benchmarks.benchmark_audio(args.benchmark_audio) else 1)
+
+    if args.benchmark_transitions:
+        sys.exit(0 if benchmarks.benchmark_transitions(args.lengths) else 1)
+
+    if args.benchmark_startup:
+        sys.exit(0 if benchmarks.benchmark_startup() else 1)
+
+    if args.record:
+        # Recording needs no hardware, the effect is rendered into the file only
+        name, path = args.record
+        from led_strips_simulator import simulator_backend
+        ledstrips = led_strips(simulator_backend([uid for uid, leds, offset in led_strips.STRIPS]))
+        frames = ledstrips.record(dict(EFFECTS)[name](ledstrips), path, args.fps)
+        print(str(frames) + ' frames with ' + str(ledstrips.MAX_LEDS) + ' LEDs recorded to ' + path + ' (' + str(os.path.getsize(path)) + ' bytes)')
+        ledstrips.close()
+        sys.exit(0)
+
     log.info('LED-Strips: Start')
 
-    # Start the class
-    ledstrips = led_strips()
+    # Start the class, it shows the saved state right away
+    if args.simulator or args.time_to_first_frame:
+        from led_strips_simulator import simulator_backend
+        ledstrips = led_strips(simulator_backend([uid for uid, leds, offset in led_strips.STRIPS], args.latency))
+    else:
+        ledstrips = led_strips()
 
-    # Wait a little bit, so everything can be initialized
-    time.sleep(0.5)
+    if args.audio:
+        ledstrips.MODE = led_strips.MODE_AUDIO
 
-    # Make a nice initial setup
-    if ledstrips.ipcon != None:
-        ledstrips.MODE_STRIPS = led_strips.MODE_BOTH_STRIPS
-        ledstrips.set_color_dot(100)
-        ledstrips.set_color_dot(100)
-        ledstrips.set_color_fading(100)
-        ledstrips.set_color_fading(100)
-        ledstrips.leds_off()
+    if args.time_to_first_frame:
+        elapsed = benchmarks.time_to_first_frame(ledstrips)
+        if elapsed != None:
+            print('{0:.1f} ms to the first frame'.format(elapsed*1000), flush=True)
+        ledstrips.close()
+        sys.exit(0 if elapsed != None else 1)
+
+    if args.benchmark:
+        benchmarks.benchmark_frame_latency(ledstrips, args.lengths)
+    elif args.play:
+        ledstrips.select_strips(led_strips.MODE_BOTH_STRIPS)
+        ledstrips.set_animation(args.play, True)
+        input('Press enter to exit.\n')
+    else:
+        # Make a nice initial setup, afterwards the strips are selected like before
+        if args.demo and ledstrips.ipcon != None:
+            strips = ledstrips.MODE_STRIPS
+            ledstrips.select_strips(led_strips.MODE_BOTH_STRIPS)
+            ledstrips.play_demo()
+            ledstrips.renderer.wait()
+            ledstrips.select_strips(strips)
 
-    input('Press enter to exit.\n')
+        if ledstrips.audio != None and args.audio == '-':
+            # The audio comes from stdin, the program ends with it
+            ledstrips.audio.join()
+        else:
+            input('Press enter to exit.\n')
 
     # Clean shutdown
+    ledstrips.renderer.stop()
     if ledstrips.ipcon != None:
-        ledstrips.MODE_STRIPS = led_strips.MODE_BOTH_STRIPS
+        ledstrips.select_strips(led_strips.MODE_BOTH_STRIPS)
         ledstrips.leds_off()
-        ledstrips.ipcon.disconnect()
+        ledstrips.log_stats()
+    ledstrips.close()
 
     log.info('LED-Strips: End')
@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks of LED-Strips.py on simulated strips, they are run with the --benchmark* options of the
+# script. The script cannot be imported by its name, so it hands itself over with use() first.
+
+import os
+import sys
+import time
+import json
+import socket
+import collections
+import logging as log
+
+from led_strips_simulator import simulator_backend, simulator_led_strip
+
+# The module of the script, the benchmarks take its classes and functions from it (script.led_strips)
+script = None
+
+# Hand over the script (its module) to the benchmarks
+def use(module):
+    global script
+    script = module
+
+# Benchmark for the full frame update latency (sending all chunks until the frame is rendered) of
+# the left LED strip for different strip lengths. The strip must be connected.
+def benchmark_frame_latency(ledstrips, lengths, frames=50):
+    # The connection is made in the background, so wait for the strip
+    timeout = time.time() + 10
+    normal_output = ledstrips.compositor.outputs[0]
+    while normal_output.led_strip == None and time.time() < timeout:
+        time.sleep(0.01)
+    if normal_output.led_strip == None:
+        log.error('LED-Strip ' + ledstrips.compositor.uids[0] + ' not connected.')
+        return []
+    led_strip = normal_output.led_strip
+    results = []
+    for leds in lengths:
+        output = script.strip_output(led_strip, ledstrips.FRAME_DURATION, leds)
+        for frame in range(frames):
+            # Every frame is different from the one before
+            value = (frame % 2) * 255
+            output.push(0, leds, [value]*leds, [0]*leds, [255-value]*leds)
+            # Wait until the strip has rendered it
+            timeout = time.time() + 1
+            while output.busy and time.time() < timeout:
+                time.sleep(0.001)
+        median, maximum = output.latency()
+        print('{0:4d} LEDs: {1:6.1f} ms median, {2:6.1f} ms max, {3:5.1f} fps'.format(leds, median*1000, maximum*1000, output.fps()))
+        results.append((leds, median, maximum))
+
+    # Put the normal output stage back
+    normal_output.attach(led_strip)
+    return results
+
+# The value at the given percentage of the sorted values
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+# Benchmark of all effects on two simulated strips for different strip lengths, so it runs without
+# hardware. Each frame of an effect is rendered as soon as the strips have rendered the one before,
+# so the frame rate follows the frame duration of the strips like with the real ones. Per effect
+# and length it reports the frames per second, the render time per frame, the packets sent and the
+# The effects have to reach the strips with this frame rate and latency (95th percentile) at least,
+# the strips render a frame each 20 ms
+EFFECTS_FPS = 40
+EFFECTS_LATENCY_P95 = 0.04
+
+# latency percentiles from sending a frame until the strip has rendered it. Each effect has to keep
+# the frame rate fps_limit and the latency (95th percentile) latency_limit, the result of an effect
+# tells whether it has (passed).
+def benchmark_effects(lengths, latency=0.0, transfer_time=0.0, fps_limit=EFFECTS_FPS, latency_limit=EFFECTS_LATENCY_P95):
+    print('effect           LEDs  frames    fps  render ms p50/p95  packets  latency ms p50/p95/p99')
+    results = []
+    for leds in lengths:
+        for name, effect in script.EFFECTS:
+            strips = [('sL1', leds, 0), ('sL2', leds, 0)]
+            backend = simulator_backend([uid for uid, length, offset in strips], latency, transfer_time)
+            ledstrips = script.led_strips(backend, strips)
+            # Wait until both strips are enumerated
+            timeout = time.time() + 1
+            while any(output.led_strip == None for output in ledstrips.compositor.outputs) and time.time() < timeout:
+                time.sleep(0.001)
+            ledstrips.MODE_STRIPS = script.led_strips.MODE_BOTH_STRIPS
+
+            outputs = [output for output in ledstrips.compositor.outputs if output != None]
+            times = []
+            generator = effect(ledstrips)
+            start = time.time()
+            while True:
+                frame_start = time.perf_counter()
+                try:
+                    next(generator)
+                except StopIteration:
+                    break
+                times.append(time.perf_counter() - frame_start)
+                # Wait until the strips have rendered the frame
+                timeout = time.time() + 1
+                while any(output.busy for output in outputs) and time.time() < timeout:
+                    time.sleep(0.0005)
+            elapsed = time.time() - start
+
+            latencies = [latency for output in outputs for latency in output.latencies]
+            result = {'effect': name, 'leds': leds, 'frames': len(times), 'fps': len(times) / elapsed,
+                      'render_p50': percentile(times, 50), 'render_p95': percentile(times, 95),
+                      'packets': sum(output.packets_sent for output in outputs),
+                      'latency_p50': percentile(latencies, 50), 'latency_p95': percentile(latencies, 95),
+                      'latency_p99': percentile(latencies, 99)}
+            result['passed'] = result['fps'] >= fps_limit and result['latency_p95'] < latency_limit
+            print('{effect:16s} {leds:4d} {frames:7d} {fps:6.1f} {0:8.3f} {1:8.3f} {packets:8d} {2:8.1f} {3:6.1f} {4:6.1f}'.format(
+                  result['render_p50']*1000, result['render_p95']*1000, result['latency_p50']*1000, result['latency_p95']*1000,
+                  result['latency_p99']*1000, **result))
+            results.append(result)
+            ledstrips.close()
+    print('Limits: fps >= {0}, latency p95 < {1} ms'.format(fps_limit, latency_limit*1000))
+    return results
+
+# Frames per second and latency of the network input on simulated strips with a local sender. Two
+# strips with the given length show one canvas, so the frames span several universes for long strips.
+# The sender sends frames at the given rate, the red value of the first LED numbers the frame. The
+# latency is the time from sending a frame until a strip has rendered it.
+def benchmark_network(lengths, protocol='artnet', fps=44, seconds=5.0, latency=0.0):
+    print('protocol  LEDs  sent  fps per strip  dropped  latency ms p50/p95/p99')
+    results = []
+    network_port = script.led_strips.NETWORK_PORT
+    network_protocol = script.led_strips.NETWORK_PROTOCOL
+    gamma = script.led_strips.GAMMA
+    # The number of the frame has to arrive unchanged
+    script.led_strips.GAMMA = 1
+    try:
+        for leds in lengths:
+            # A free port on this machine
+            probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            probe.bind(('127.0.0.1', 0))
+            script.led_strips.NETWORK_PORT = probe.getsockname()[1]
+            probe.close()
+            script.led_strips.NETWORK_PROTOCOL = protocol
+            strips = [('n0', leds, 0), ('n1', leds, leds)]
+            backend = simulator_backend([uid for uid, strip_leds, offset in strips], latency)
+            ledstrips = script.led_strips(backend, strips)
+            timeout = time.time() + 5
+            while any(output.led_strip == None for output in ledstrips.compositor.outputs) and time.time() < timeout:
+                time.sleep(0.01)
+            ledstrips.select_strips(script.led_strips.MODE_BOTH_STRIPS)
+
+            sender = script.network_sender('127.0.0.1', script.led_strips.NETWORK_PORT, protocol)
+            sent = collections.defaultdict(list)
+            hues = script.hue_ramp(2*leds)
+            start = time.time()
+            frames = 0
+            while time.time() - start < seconds:
+                number = frames % 250 + 1
+                frame = script.frame_hsv([(hue + frames / 100) % 1 for hue in hues], 1, 1)
+                r = list(frame[0])
+                r[0] = number
+                sent[number].append(time.time())
+                sender.send(r, frame[1], frame[2])
+                frames = frames + 1
+                time.sleep(max(0, start + frames / fps - time.time()))
+            time.sleep(0.2)
+            sender.close()
+
+            # The frames rendered by the strips while the sender was running
+            latencies = []
+            rendered = 0
+            for uid, strip_leds, offset in strips:
+                for when, red, blue, green in backend.instances[uid].frames:
+                    if when < start or when > start + seconds:
+                        continue
+                    rendered = rendered + 1
+                    if offset == 0:
+                        times = [time_sent for time_sent in sent[red[0]] if time_sent <= when]
+                        if times:
+                            latencies.append(when - times[-1])
+            result = {'protocol': protocol, 'leds': leds, 'sent': frames, 'fps': rendered / len(strips) / seconds,
+                      'dropped': ledstrips.network.dropped, 'latency_p50': percentile(latencies, 50),
+                      'latency_p95': percentile(latencies, 95), 'latency_p99': percentile(latencies, 99)}
+            print('{protocol:8s} {leds:5d} {sent:5d} {fps:14.1f} {dropped:8d} {0:9.1f} {1:6.1f} {2:6.1f}'.format(
+                  result['latency_p50']*1000, result['latency_p95']*1000, result['latency_p99']*1000, **result))
+            results.append(result)
+            ledstrips.close()
+    finally:
+        script.led_strips.NETWORK_PORT = network_port
+        script.led_strips.NETWORK_PROTOCOL = network_protocol
+        script.led_strips.GAMMA = gamma
+    return results
+
+# The time from the samples of an analysis until a strip shows its levels should stay below this
+AUDIO_LATENCY_TARGET = 0.03
+
+# Write a test WAV file: a bass drum twice per second over a tone which sweeps from 200 Hz to 4 kHz
+def write_test_audio(path, seconds=5.0, rate=44100):
+    import wave
+    times = script.np.arange(int(seconds * rate)) / rate
+    beat = times % 0.5
+    drum = script.np.sin(2 * script.np.pi * 60 * beat) * script.np.exp(-beat * 12)
+    tone = 0.3 * script.np.sin(2 * script.np.pi * (200 * times + (4000 - 200) / (2 * seconds) * times * times))
+    samples = ((drum * 0.6 + tone) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(rate)
+        audio.writeframes(samples.tobytes())
+
+# Latency of the audio-reactive mode with a recorded WAV file (a generated one without a path) on two
+# simulated strips. The file is played in real time and the latency is the time from the samples of
+# an analysis until a strip has rendered its levels, found by the color and the number of LEDs of the
+# frame. Returns whether the 95th percentile is within the target.
+def benchmark_audio(path=None, leds=150, target=AUDIO_LATENCY_TARGET):
+    import tempfile
+    if script.np is None:
+        print('The audio-reactive mode needs NumPy')
+        return False
+    audio_source = script.led_strips.AUDIO_SOURCE
+    gamma = script.led_strips.GAMMA
+    directory = tempfile.TemporaryDirectory()
+    try:
+        if not path:
+            path = os.path.join(directory.name, 'test.wav')
+            write_test_audio(path)
+        script.led_strips.AUDIO_SOURCE = path
+        # The frames are compared with the strips, so they must not be corrected
+        script.led_strips.GAMMA = 1
+        strips = [('a0', leds, 0), ('a1', leds, 0)]
+        backend = simulator_backend([uid for uid, strip_leds, offset in strips])
+        ledstrips = script.led_strips(backend, strips)
+        ledstrips.select_strips(script.led_strips.MODE_BOTH_STRIPS)
+        ledstrips.MODE = script.led_strips.MODE_AUDIO
+
+        # The frame of each analysis with the time of its samples
+        def key(r, g, b):
+            return (int(r[0]), int(g[0]), int(b[0]), sum(1 for x, y, z in zip(r, g, b) if x or y or z))
+        shown = []
+        show_audio = ledstrips.show_audio
+        def record(levels, received):
+            frame = show_audio(levels, received)
+            shown.append((time.time(), received, key(frame[0], frame[1], frame[2])))
+            return frame
+        ledstrips.show_audio = record
+
+        start = time.time()
+        ledstrips.audio.join()
+        time.sleep(0.2)
+        elapsed = time.time() - start
+        ledstrips.close()
+
+        # Each rendered frame shows the newest analysis with the same frame which was shown before
+        latencies = []
+        rendered = 0
+        for when, red, blue, green in backend.instances['a0'].frames:
+            if when < start:
+                continue
+            rendered = rendered + 1
+            frame = key(red, green, blue)
+            for pushed, received, pushed_frame in reversed(shown):
+                if pushed <= when and pushed_frame == frame:
+                    latencies.append(when - received)
+                    break
+    finally:
+        script.led_strips.AUDIO_SOURCE = audio_source
+        script.led_strips.GAMMA = gamma
+        directory.cleanup()
+
+    audio = ledstrips.audio
+    print('analyses/s  fps per strip  analysis ms p50/p95  to the strips ms p50/p95/p99  target ms')
+    print('{0:10.1f} {1:14.1f} {2:10.3f} {3:7.3f} {4:16.1f} {5:6.1f} {6:6.1f} {7:9.0f}'.format(
+          audio.analyses / elapsed, rendered / elapsed, percentile(audio.analysis_times, 50)*1000,
+          percentile(audio.analysis_times, 95)*1000, percentile(latencies, 50)*1000, percentile(latencies, 95)*1000,
+          percentile(latencies, 99)*1000, target*1000))
+    return bool(latencies) and percentile(latencies, 95) <= target
+
+# Throughput of the render processes for an installation with many simulated strips on one host.
+# The strips lie side by side on the canvas and show the moving gradient, which changes every LED in
+# each frame, at the frame rate of the strips. Each process only renders the span of its strips. For each number of processes (0 = all in this process) it reports the frames sent
+# per second to all strips together and per strip. With enough cores the frames per strip stay at
+# the frame rate of the strips while one process cannot keep up with many strips.
+def benchmark_processes(counts, strips=16, leds=150, seconds=5.0, latency=0.0):
+    print('processes  strips  LEDs  frames/s  per strip  packets/s')
+    results = []
+    processes = script.led_strips.PROCESSES
+    try:
+        for count in counts:
+            script.led_strips.PROCESSES = count
+            installation = [('s' + str(number), leds, number * leds) for number in range(strips)]
+            ledstrips = script.led_strips(simulator_backend([uid for uid, strip_leds, offset in installation], latency), installation)
+            if count == 0:
+                # Wait until all strips are enumerated
+                timeout = time.time() + 5
+                while any(output.led_strip == None for output in ledstrips.compositor.outputs) and time.time() < timeout:
+                    time.sleep(0.01)
+            else:
+                # The processes have to start and enumerate their strips first
+                time.sleep(3)
+            ledstrips.select_strips(script.led_strips.MODE_BOTH_STRIPS)
+            ledstrips.play('gradient', 100, 1000 / ledstrips.FRAME_DURATION, True)
+            time.sleep(seconds)
+            if count == 0:
+                ledstrips.renderer.stop()
+                stats = [output.stats() for output in ledstrips.compositor.outputs]
+            else:
+                stats = ledstrips.pool.close()
+                ledstrips.pool = None
+            ledstrips.close()
+            frames = sum(stat['sent'] for stat in stats)
+            packets = sum(stat['packets'] for stat in stats)
+            result = {'processes': count, 'strips': strips, 'leds': leds, 'fps': frames / seconds,
+                      'strip_fps': frames / seconds / strips, 'packets': packets / seconds}
+            print('{processes:9d} {strips:7d} {leds:5d} {fps:9.1f} {strip_fps:10.1f} {packets:10.1f}'.format(**result))
+            results.append(result)
+    finally:
+        script.led_strips.PROCESSES = processes
+    return results
+
+# Time per frame of the post-processing for different strip lengths: gamma correction only, with the
+# current limiter (at half of the current of the frame) and with dithering too
+def benchmark_post_processing(lengths, frames=500):
+    print('LEDs  post-processing ms p50/max per frame')
+    print('      gamma            +limiter         +dithering')
+    results = []
+    for leds in lengths:
+        frame = script.frame_buffer(leds)
+        rainbow = script.frame_hsv(script.hue_ramp(leds), 1, 1)
+        frame.write(0, leds, rainbow[0], rainbow[1], rainbow[2])
+        # The estimated current of the frame, the limiter has to scale it down to the half
+        current = sum(sum(plane[0:leds]) for plane in (frame.r, frame.g, frame.b)) / 255 * 20 + leds
+        result = {'leds': leds}
+        line = '{0:4d}'.format(leds)
+        for name, settings in (('gamma', {}), ('limiter', {'max_current': current / 2}), ('dithering', {'max_current': current / 2, 'dithering': True})):
+            post = script.post_processor(frame, script.frame_buffer(leds), **settings)
+            times = []
+            for number in range(frames):
+                start = time.perf_counter()
+                post.process()
+                times.append(time.perf_counter() - start)
+            result[name] = (percentile(times, 50), max(times))
+            line = line + '  {0:7.3f} {1:7.3f}'.format(result[name][0]*1000, result[name][1]*1000)
+        print(line)
+        results.append(result)
+    return results
+
+# The blend of a transition may take this many seconds per frame
+TRANSITION_BUDGET = 0.001
+
+# Time of the blend per frame for each transition curve and strip length, and the frame rate of two
+# simulated strips during a transition from the gradient to the dot. The blend has to stay within the
+# budget, so a transition keeps the frame rate of the strips. Returns whether all blends are within it.
+def benchmark_transitions(lengths, frames=500, budget=TRANSITION_BUDGET):
+    print('LEDs  blend ms p50/max per frame                       fps during')
+    print('      linear           eased            wipe             transition')
+    passed = True
+    for leds in lengths:
+        line = '{0:4d}'.format(leds)
+        rainbow = script.frame_hsv(script.hue_ramp(leds), 1, 1)
+        for curve in script.frame_blend.CURVES:
+            blend = script.frame_blend(leds, curve)
+            blend.outgoing.write(0, leds, rainbow[0], rainbow[1], rainbow[2])
+            blend.incoming.fill(255, 255, 255)
+            times = []
+            for number in range(frames):
+                start = time.perf_counter()
+                blend.blend(number / frames)
+                times.append(time.perf_counter() - start)
+            passed = passed and percentile(times, 50) <= budget
+            line = line + '  {0:7.3f} {1:7.3f}'.format(percentile(times, 50)*1000, max(times)*1000)
+
+        strips = [('sL1', leds, 0), ('sL2', leds, 0)]
+        backend = simulator_backend([uid for uid, length, offset in strips])
+        ledstrips = script.led_strips(backend, strips)
+        timeout = time.time() + 1
+        while any(output.led_strip == None for output in ledstrips.compositor.outputs) and time.time() < timeout:
+            time.sleep(0.001)
+        ledstrips.MODE_STRIPS = script.led_strips.MODE_BOTH_STRIPS
+        ledstrips.play('gradient', loop=True)
+        time.sleep(0.2)
+        start = time.time()
+        ledstrips.plugins.get('dot').position(ledstrips, None)
+        time.sleep(ledstrips.TRANSITION_DURATION + 0.1)
+        rendered = [frame for uid, length, offset in strips for frame in backend.instances[uid].frames
+                    if start <= frame[0] < start + ledstrips.TRANSITION_DURATION]
+        ledstrips.close()
+        print(line + '  {0:8.1f}'.format(len(rendered) / len(strips) / ledstrips.TRANSITION_DURATION))
+    return passed
+
+# A strip which takes all packets and renders nothing, so only the output stage is measured
+class discard_led_strip:
+    FUNCTION_SET_RGB_VALUES = 1
+    CALLBACK_FRAME_RENDERED = 6
+
+    def set_response_expected(self, function_id, response_expected):
+        pass
+
+    def register_callback(self, callback_id, function):
+        pass
+
+    def set_frame_duration(self, duration):
+        pass
+
+    def set_rgb_values(self, index, length, r, g, b):
+        pass
+
+# led_strips with one strip of the given length which takes the frames and renders nothing, without
+# the render thread and the connection, so the frames of an effect can be rendered one by one
+def discarding_led_strips(leds):
+    ledstrips = script.led_strips(simulator_backend([]), [('d0', leds, 0)])
+    ledstrips.renderer.stop()
+    ledstrips.connection.stop()
+    ledstrips.connection.join()
+    ledstrips.compositor.outputs[0].attach(discard_led_strip())
+    ledstrips.select_strips(script.led_strips.MODE_BOTH_STRIPS)
+    return ledstrips
+
+# The memory which each call of step(number) leaves allocated (retained) and the largest size of its
+# temporary objects (peak) in bytes, measured with tracemalloc over frames calls. The first run warms
+# up the measurement itself, the second one counts.
+def measure_allocations(step, frames):
+    import tracemalloc
+    tracemalloc.start()
+    try:
+        for run in range(2):
+            start = tracemalloc.get_traced_memory()[0]
+            peak = 0
+            for number in range(frames):
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                step(run * frames + number)
+                peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+            retained = (tracemalloc.get_traced_memory()[0] - start) / frames
+    finally:
+        tracemalloc.stop()
+    return retained, peak
+
+# measure_allocations of the frames which render(number) shows on the strip of discarding_led_strips,
+# the strip renders each frame at once. The statistics of the output are bounded, they are filled first.
+def measure_discarded(ledstrips, render, frames):
+    strip = ledstrips.compositor.outputs[0]
+    def step(number):
+        render(number)
+        strip.cb_frame_rendered(strip.leds)
+    for number in range(strip.latencies.maxlen):
+        step(number)
+    result = measure_allocations(step, frames)
+    # The last frame is rendered too, so nothing is left to flush when ledstrips is closed
+    strip.cb_frame_rendered(strip.leds)
+    return result
+
+# The temporary objects per frame (slice views, the segments of the compositor and their bookkeeping)
+# may take at most this many bytes, independent of the number of LEDs
+ALLOCATION_PEAK = 2048
+
+# Allocations per frame measured with tracemalloc for different strip lengths, of the output stage and
+# of the effects which render into their frame in place. For the output stage two prepared frames
+# which differ in every LED are pushed in turns, so every frame is sent in full. Nothing may be left
+# allocated by the frames (retained) and the temporary objects (peak) must stay within the constant
+# peak_limit. Returns whether all lengths passed.
+def benchmark_allocations(lengths, frames=2000, peak_limit=ALLOCATION_PEAK):
+    print('stage   LEDs  retained bytes/frame  peak bytes/frame')
+    passed = True
+    for leds in lengths:
+        output = script.strip_output(discard_led_strip(), 20, leds)
+        # The frames as buffers, like the frames which the effects render in place
+        prepared = [[bytes(plane) for plane in frame] for frame in (script.frame_solid(255, 0, 0, leds, leds), script.frame_solid(0, 0, 255, leds, leds))]
+        # The statistics of the output are bounded, fill them first
+        for number in range(output.latencies.maxlen):
+            frame = prepared[number % 2]
+            output.push(0, leds, frame[0], frame[1], frame[2])
+            output.cb_frame_rendered(leds)
+        def push(number):
+            frame = prepared[number % 2]
+            output.push(0, leds, frame[0], frame[1], frame[2])
+            output.cb_frame_rendered(leds)
+        results = [('output', measure_allocations(push, frames))]
+
+        # The effects which render into their frame in place: the dot moving over the strip again and
+        # again and the poti callbacks for the number of LEDs and the hue
+        ledstrips = discarding_led_strips(leds)
+        def dots():
+            while True:
+                yield from ledstrips.effect_color_dot(None)
+        effect = dots()
+        for stage, render in (('dot', lambda number: next(effect)),
+                              ('leds', lambda number: ledstrips.set_leds(number % 300)),
+                              ('hue', lambda number: ledstrips.set_hue(number % 300))):
+            results.append((stage, measure_discarded(ledstrips, render, frames)))
+        effect.close()
+        ledstrips.close()
+
+        for stage, (retained, peak) in results:
+            # A few bytes once (e.g. a counter) are fine, each allocation per frame would be at least one byte per frame
+            passed = passed and retained < 1 and peak <= peak_limit
+            print('{0:6s} {1:5d} {2:21.1f} {3:17d}'.format(stage, leds, retained, peak))
+    print('Limits: retained < 1 byte/frame, peak <= {0} bytes/frame'.format(peak_limit))
+    return passed
+
+# The time from the start of the program until the first frame is rendered by a simulated strip, None
+# if no frame came within the timeout
+def time_to_first_frame(ledstrips, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        rendered = [strip.frames[0][0] for strip in list(ledstrips.backend.instances.values())
+                    if isinstance(strip, simulator_led_strip) and strip.frames]
+        if rendered:
+            return min(rendered) - script.STARTED
+        time.sleep(0.001)
+    return None
+
+# The time to the first frame should stay below this many seconds (from starting the interpreter)
+STARTUP_TARGET = 0.5
+
+# Benchmark of the start with a saved state: the program is started runs times with simulated strips
+# and the time from starting it until it reports the first frame is measured, which includes the
+# start of the interpreter and all imports. Returns whether the median is within the target.
+def benchmark_startup(runs=7, target=STARTUP_TARGET):
+    import subprocess
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'state.json')
+        with open(path, 'w') as f:
+            json.dump({'MODE': script.led_strips.MODE_HUE, 'MODE_STRIPS': script.led_strips.MODE_BOTH_STRIPS, 'POSITION_HUE': 0.5}, f)
+        times = []
+        for run in range(runs):
+            started = time.time()
+            process = subprocess.Popen([sys.executable, os.path.abspath(script.__file__), '--time-to-first-frame', '--state-file', path],
+                                       stdout=subprocess.PIPE, universal_newlines=True)
+            line = process.stdout.readline()
+            first_frame = time.time()
+            process.communicate()
+            if process.returncode != 0 or not line:
+                print('Run ' + str(run + 1) + ' got no frame')
+                return False
+            times.append(first_frame - started)
+    times.sort()
+    median = percentile(times, 50)
+    print('Time to the first frame: {0:.1f} ms median, {1:.1f} ms min, {2:.1f} ms max, target {3:.0f} ms'.format(
+          median*1000, times[0]*1000, times[-1]*1000, target*1000))
+    return median <= target
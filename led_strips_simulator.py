@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+# Simulated brickd and bricklets for LED-Strips.py, used with --simulator, by the render processes of
+# a simulated installation and by the benchmarks
+
+import time
+import queue
+import threading
+import collections
+import logging as log
+
+# Device backend which simulates brickd and the bricklets in this process, so everything runs
+# without hardware. It offers the same classes as the Tinkerforge bindings. The LED strips record
+# every rendered frame with a timestamp and every request can take a modelled latency.
+class simulator_backend:
+    def __init__(self, led_strip_uids, latency=0.0, transfer_time=0.0, history=10000, available=True):
+        # Round trip of a request which expects a response and time on the wire for every request
+        self.latency = latency
+        self.transfer_time = transfer_time
+        self.history = history
+        # Without brickd connect fails like a refused socket
+        self.available = available
+        self.devices = [(uid, simulator_led_strip.DEVICE_IDENTIFIER) for uid in led_strip_uids]
+        self.devices.append(('sMT', simulator_multi_touch.DEVICE_IDENTIFIER))
+        self.devices.append(('sRP', simulator_rotary_poti.DEVICE_IDENTIFIER))
+        # The device objects by UID, so benchmarks can look at the frames or turn the rotary poti
+        self.instances = {}
+
+        backend = self
+        class IPConnection(simulator_connection):
+            def __init__(self):
+                simulator_connection.__init__(self, backend)
+        self.IPConnection = IPConnection
+        self.Error = simulator_error
+        self.LEDStrip = simulator_led_strip
+        self.MultiTouch = simulator_multi_touch
+        self.RotaryPoti = simulator_rotary_poti
+
+class simulator_error(Exception):
+    TIMEOUT = -1
+    NOT_CONNECTED = -8
+
+    def __init__(self, value, description):
+        Exception.__init__(self, description)
+        self.value = value
+        self.description = description
+
+# The simulated IP Connection. Like the real one it calls all callbacks from one callback thread.
+class simulator_connection:
+    CALLBACK_ENUMERATE = 253
+    CALLBACK_CONNECTED = 0
+    CALLBACK_DISCONNECTED = 1
+
+    ENUMERATION_TYPE_AVAILABLE = 0
+    ENUMERATION_TYPE_CONNECTED = 1
+    ENUMERATION_TYPE_DISCONNECTED = 2
+
+    CONNECT_REASON_REQUEST = 0
+    CONNECT_REASON_AUTO_RECONNECT = 1
+
+    DISCONNECT_REASON_REQUEST = 0
+    DISCONNECT_REASON_ERROR = 1
+
+    CONNECTION_STATE_DISCONNECTED = 0
+    CONNECTION_STATE_CONNECTED = 1
+    CONNECTION_STATE_PENDING = 2
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.callbacks = {}
+        self.connected = False
+        self.pending = False
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def connect(self, host, port):
+        if self.connected:
+            raise simulator_error(-7, 'Already connected')
+        if not self.backend.available:
+            raise ConnectionRefusedError('Connection refused')
+        self.connected = True
+        self.thread = threading.Thread(target=self.dispatch, name='Simulator callbacks')
+        self.thread.daemon = True
+        self.thread.start()
+        self.call(self.CALLBACK_CONNECTED, self.CONNECT_REASON_REQUEST)
+
+    def disconnect(self):
+        self.connected = False
+        self.queue.put(None)
+
+    # Simulate a lost connection which the auto reconnect restores after the given time
+    def interrupt(self, duration):
+        self.connected = False
+        self.pending = True
+        self.call(self.CALLBACK_DISCONNECTED, self.DISCONNECT_REASON_ERROR)
+        def reconnect():
+            self.connected = True
+            self.pending = False
+            self.call(self.CALLBACK_CONNECTED, self.CONNECT_REASON_AUTO_RECONNECT)
+        timer = threading.Timer(duration, reconnect)
+        timer.daemon = True
+        timer.start()
+
+    def get_connection_state(self):
+        if self.pending:
+            return self.CONNECTION_STATE_PENDING
+        return self.CONNECTION_STATE_CONNECTED if self.connected else self.CONNECTION_STATE_DISCONNECTED
+
+    def set_auto_reconnect(self, auto_reconnect):
+        pass
+
+    def register_callback(self, callback_id, function):
+        self.callbacks[callback_id] = function
+
+    def enumerate(self):
+        self.request(False)
+        for uid, device_identifier in self.backend.devices:
+            self.call(self.CALLBACK_ENUMERATE, uid, '0', 'a', (1, 0, 0), (2, 0, 0), device_identifier, self.ENUMERATION_TYPE_AVAILABLE)
+
+    # Model the time of a request
+    def request(self, response_expected):
+        if not self.connected:
+            raise simulator_error(simulator_error.NOT_CONNECTED, 'Not connected')
+        delay = self.backend.transfer_time + (self.backend.latency if response_expected else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    # Queue a callback of the connection itself or of a device for the callback thread
+    def call(self, callback_id, *args, device=None):
+        callbacks = self.callbacks if device == None else device.callbacks
+        self.queue.put((callbacks, callback_id, args, time.time()))
+
+    def dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item == None:
+                break
+            callbacks, callback_id, args, queued = item
+            function = callbacks.get(callback_id)
+            if function != None:
+                try:
+                    function(*args)
+                except Exception as e:
+                    log.error('Callback failed: ' + str(e))
+
+class simulator_device:
+    def __init__(self, uid, ipcon):
+        self.uid = uid
+        self.ipcon = ipcon
+        self.callbacks = {}
+        self.response_expected = {}
+        ipcon.backend.instances[uid] = self
+
+    def register_callback(self, callback_id, function):
+        self.callbacks[callback_id] = function
+
+    def set_response_expected(self, function_id, response_expected):
+        self.response_expected[function_id] = response_expected
+
+    def request(self, function_id=None, response_expected=True):
+        self.ipcon.request(self.response_expected.get(function_id, response_expected))
+
+class simulator_led_strip(simulator_device):
+    DEVICE_IDENTIFIER = 231
+    CALLBACK_FRAME_RENDERED = 6
+    FUNCTION_SET_RGB_VALUES = 1
+
+    def __init__(self, uid, ipcon):
+        simulator_device.__init__(self, uid, ipcon)
+        self.lock = threading.Lock()
+        self.frame_duration = 100
+        self.leds = 0
+        self.buffer = [[], [], []]
+        self.dirty = False
+        self.packets = 0
+        # The rendered frames as (time, r, g, b)
+        self.frames = collections.deque(maxlen=ipcon.backend.history)
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self.render, name='Simulator ' + uid)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def set_frame_duration(self, duration):
+        self.request(response_expected=False)
+        self.frame_duration = duration
+        self.wakeup.set()
+
+    def set_rgb_values(self, index, length, r, g, b):
+        self.request(self.FUNCTION_SET_RGB_VALUES, False)
+        with self.lock:
+            if index + length > self.leds:
+                for row in self.buffer:
+                    row.extend([0]*(index + length - self.leds))
+                self.leds = index + length
+            for row, values in zip(self.buffer, (r, g, b)):
+                row[index:index+length] = [int(value) for value in values[:length]]
+            self.dirty = True
+            self.packets = self.packets + 1
+
+    # Render the buffer every frame duration if something has changed
+    def render(self):
+        # Runs until the strip is replaced by a new object or the connection is closed
+        while self.ipcon.thread.is_alive() and self.ipcon.backend.instances.get(self.uid) is self:
+            self.wakeup.wait(self.frame_duration / 1000)
+            self.wakeup.clear()
+            with self.lock:
+                if not self.dirty:
+                    continue
+                self.dirty = False
+                self.frames.append((time.time(), list(self.buffer[0]), list(self.buffer[1]), list(self.buffer[2])))
+                leds = self.leds
+            self.ipcon.call(self.CALLBACK_FRAME_RENDERED, leds, device=self)
+
+class simulator_multi_touch(simulator_device):
+    DEVICE_IDENTIFIER = 234
+    CALLBACK_TOUCH_STATE = 5
+
+    def set_electrode_config(self, enabled_electrodes):
+        self.request(response_expected=False)
+
+    def recalibrate(self):
+        self.request(response_expected=False)
+
+    # Simulate touching the electrodes
+    def touch(self, state):
+        self.ipcon.call(self.CALLBACK_TOUCH_STATE, state, device=self)
+
+class simulator_rotary_poti(simulator_device):
+    DEVICE_IDENTIFIER = 215
+    CALLBACK_POSITION = 13
+    CALLBACK_POSITION_REACHED = 15
+
+    def __init__(self, uid, ipcon):
+        simulator_device.__init__(self, uid, ipcon)
+        self.position = 0
+        self.period = 0
+        self.threshold = ('x', 0, 0)
+
+    def get_position(self):
+        self.request()
+        return self.position
+
+    def set_position_callback_period(self, period):
+        self.request(response_expected=False)
+        self.period = period
+
+    def set_position_callback_threshold(self, option, minimum, maximum):
+        self.request()
+        self.threshold = (option, minimum, maximum)
+
+    def set_debounce_period(self, debounce):
+        self.request(response_expected=False)
+
+    # Simulate turning the knob
+    def turn(self, position):
+        self.position = position
+        if self.period > 0:
+            self.ipcon.call(self.CALLBACK_POSITION, position, device=self)
+        option, minimum, maximum = self.threshold
+        if option == 'o' and (position < minimum or position > maximum):
+            self.ipcon.call(self.CALLBACK_POSITION_REACHED, position, device=self)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+# Tests of LED-Strips.py on simulated strips, run with: python -m pytest tests
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The script cannot be imported by its name, so it is loaded from its file
+spec = importlib.util.spec_from_file_location('led_strips_script', os.path.join(ROOT, 'LED-Strips.py'))
+script = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = script
+spec.loader.exec_module(script)
+
+from led_strips_simulator import simulator_backend
+import led_strips_benchmarks as benchmarks
+benchmarks.use(script)
+
+# Start led_strips on simulated strips and wait until all of them are enumerated
+def start(strips, latency=0.0):
+    backend = simulator_backend([uid for uid, leds, offset in strips], latency)
+    ledstrips = script.led_strips(backend, strips)
+    timeout = time.time() + 5
+    while any(output.led_strip == None for output in ledstrips.compositor.outputs) and time.time() < timeout:
+        time.sleep(0.01)
+    ledstrips.select_strips(script.led_strips.MODE_BOTH_STRIPS)
+    return backend, ledstrips
+
+class compositor_test(unittest.TestCase):
+    # The strips of a frame may be this many seconds apart (median and maximum)
+    SKEW_MEDIAN = 0.005
+    SKEW_MAX = 0.02
+
+    def test_skew(self):
+        strips = [('s' + str(number), 150, 0) for number in range(4)]
+        backend, ledstrips = start(strips)
+        try:
+            ledstrips.play('gradient', loop=True)
+            time.sleep(1)
+            ledstrips.renderer.stop()
+            # The strips render the last frame
+            time.sleep(0.1)
+            median, maximum = ledstrips.compositor.skew()
+        finally:
+            ledstrips.close()
+        self.assertGreater(ledstrips.compositor.frames, 5)
+        self.assertLess(median, self.SKEW_MEDIAN)
+        self.assertLess(maximum, self.SKEW_MAX)
+        # All strips have the same offset, so they show the same frames
+        last = [backend.instances[uid].frames[-1][1:] for uid, leds, offset in strips]
+        self.assertTrue(all(frame == last[0] for frame in last))
+
+class output_test(unittest.TestCase):
+    # The last frame before the end (all LEDs off) reaches the strips, also when they are still busy
+    def test_flush(self):
+        strips = [('o0', 150, 0), ('o1', 150, 0)]
+        for run in range(3):
+            backend, ledstrips = start(strips)
+            ledstrips.play('dot', loop=True)
+            time.sleep(0.2)
+            ledstrips.renderer.stop()
+            ledstrips.leds_off()
+            ledstrips.close()
+            for uid, leds, offset in strips:
+                when, red, blue, green = backend.instances[uid].frames[-1]
+                self.assertFalse(any(red) or any(green) or any(blue))
+
+class metrics_test(unittest.TestCase):
+    # The render time is observed per effect, with the names of the plugins
+    def test_render_labels(self):
+        backend, ledstrips = start([('m0', 30, 0), ('m1', 30, 0)])
+        ledstrips.metrics.enabled = True
+        try:
+            ledstrips.plugins.get('dot').position(ledstrips, None)
+            time.sleep(0.7)
+            ledstrips.plugins.get('randomly').position(ledstrips, None)
+            time.sleep(0.7)
+        finally:
+            ledstrips.close()
+        labels = set(labels for name, labels in ledstrips.metrics.histograms if name == 'ledstrips_render_seconds')
+        self.assertEqual(labels, set([(('effect', 'dot'),), (('effect', 'randomly'),)]))
+        # The frames sent to each strip are counted per effect too
+        counters, histograms = ledstrips.metrics.collect()
+        sent = dict((labels, value) for name, labels, value in counters if name == 'ledstrips_frames_sent_total')
+        for uid in ('m0', 'm1'):
+            self.assertGreater(sent.get((('strip', uid), ('effect', 'dot')), 0), 0)
+            self.assertGreater(sent.get((('strip', uid), ('effect', 'randomly')), 0), 0)
+
+class allocation_test(unittest.TestCase):
+    # The effects which render into their frame in place leave nothing allocated per frame and their
+    # temporary objects do not grow with the number of LEDs
+    def test_in_place(self):
+        for leds in (150, 2400):
+            ledstrips = benchmarks.discarding_led_strips(leds)
+            def dots():
+                while True:
+                    yield from ledstrips.effect_color_dot(None)
+            effect = dots()
+            try:
+                for stage, render in (('dot', lambda number: next(effect)),
+                                      ('leds', lambda number: ledstrips.set_leds(number % 300)),
+                                      ('hue', lambda number: ledstrips.set_hue(number % 300))):
+                    with self.subTest(stage=stage, leds=leds):
+                        retained, peak = benchmarks.measure_discarded(ledstrips, render, 500)
+                        self.assertLess(retained, 1)
+                        self.assertLessEqual(peak, benchmarks.ALLOCATION_PEAK)
+            finally:
+                effect.close()
+                ledstrips.close()
+
+class effects_test(unittest.TestCase):
+    # Every effect reaches the strips with the frame rate and latency of the benchmark limits
+    def test_frame_rate(self):
+        for result in benchmarks.benchmark_effects([30]):
+            with self.subTest(effect=result['effect']):
+                self.assertGreater(result['frames'], 0)
+                self.assertGreaterEqual(result['fps'], benchmarks.EFFECTS_FPS)
+                self.assertLess(result['latency_p95'], benchmarks.EFFECTS_LATENCY_P95)
+
+class animation_test(unittest.TestCase):
+    # A file which is shorter than the header is no animation file
+    def test_short_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'short.leda')
+            with open(path, 'wb') as f:
+                f.write(script.ANIMATION_MAGIC + bytes([script.ANIMATION_VERSION]))
+            with self.assertRaises(ValueError):
+                script.animation_file(path)
+
+class startup_test(unittest.TestCase):
+    # The program shows the saved state with its first frame within the startup target
+    def test_time_to_first_frame(self):
+        self.assertTrue(benchmarks.benchmark_startup(runs=5))
+
+class network_test(unittest.TestCase):
+    # The frames of a local sender have to reach the strips with this frame rate and latency (95th percentile)
+    FPS = 40
+    LATENCY_P95 = 0.05
+
+    def test_frame_rate(self):
+        for protocol in ('artnet', 'e131'):
+            with self.subTest(protocol=protocol):
+                result, = benchmarks.benchmark_network([150], protocol, seconds=2)
+                self.assertGreaterEqual(result['fps'], self.FPS)
+                self.assertEqual(result['dropped'], 0)
+                self.assertLess(result['latency_p95'], self.LATENCY_P95)
+
+class transition_test(unittest.TestCase):
+    LEDS = 300
+
+    @unittest.skipIf(script.np is None, 'the budget is for the vectorized blend')
+    def test_blend_budget(self):
+        rainbow = script.frame_hsv(script.hue_ramp(self.LEDS), 1, 1)
+        for curve in script.frame_blend.CURVES:
+            with self.subTest(curve=curve):
+                blend = script.frame_blend(self.LEDS, curve)
+                blend.outgoing.write(0, self.LEDS, rainbow[0], rainbow[1], rainbow[2])
+                blend.incoming.fill(255, 255, 255)
+                times = []
+                for number in range(200):
+                    start = time.perf_counter()
+                    blend.blend(number / 200)
+                    times.append(time.perf_counter() - start)
+                self.assertLessEqual(benchmarks.percentile(times, 50), benchmarks.TRANSITION_BUDGET)
+
+    # During a transition the strips keep (nearly) their frame rate
+    def test_frame_rate(self):
+        strips = [('t0', self.LEDS, 0), ('t1', self.LEDS, 0)]
+        backend, ledstrips = start(strips)
+        try:
+            ledstrips.play('gradient', loop=True)
+            time.sleep(0.2)
+            start_time = time.time()
+            ledstrips.plugins.get('dot').position(ledstrips, None)
+            time.sleep(ledstrips.TRANSITION_DURATION + 0.1)
+        finally:
+            ledstrips.close()
+        rendered = [frame for uid, leds, offset in strips for frame in backend.instances[uid].frames
+                    if start_time <= frame[0] < start_time + ledstrips.TRANSITION_DURATION]
+        fps = len(rendered) / len(strips) / ledstrips.TRANSITION_DURATION
+        self.assertGreaterEqual(fps, 0.8 * 1000 / ledstrips.FRAME_DURATION)
+
+    # A transition which starts during another one blends from the frames of the first transition,
+    # only the newest transition goes to the strips
+    def test_nested(self):
+        strips = [('t0', self.LEDS, 0), ('t1', self.LEDS, 0)]
+        backend, ledstrips = start(strips)
+        calls = []
+        show_blend = ledstrips.show_blend
+        def record(layer, frame):
+            calls.append((time.time(), layer, frame))
+            show_blend(layer, frame)
+        ledstrips.show_blend = record
+        try:
+            ledstrips.play('gradient', loop=True)
+            time.sleep(0.2)
+            ledstrips.plugins.get('dot').position(ledstrips, None)
+            time.sleep(0.3)
+            second = time.time()
+            ledstrips.plugins.get('randomly').position(ledstrips, None)
+            time.sleep(ledstrips.TRANSITION_DURATION + 0.1)
+        finally:
+            ledstrips.close()
+        first_frames = set(id(frame) for when, layer, frame in calls if when < second and layer is None)
+        # From its first nested frame on the first transition only blends into the second one
+        nested = [number for number, (when, layer, frame) in enumerate(calls) if when >= second and layer is not None]
+        self.assertTrue(first_frames)
+        self.assertTrue(nested)
+        direct = [frame for when, layer, frame in calls[nested[0]:] if layer is None]
+        self.assertTrue(direct)
+        self.assertFalse([frame for frame in direct if id(frame) in first_frames])
+
+if __name__ == '__main__':
+    unittest.main()